@@ -12,24 +12,438 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 # Many code inspiration from gnome-music at the GNOME project
 
-from gi.repository import Gtk, Gdk, GObject, GdkPixbuf
+from gi.repository import Gtk, Gdk, Gio, GLib, GObject, GdkPixbuf
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import cpu_count
+from threading import Lock, get_ident
+import mutagen
+from mutagen.flac import Picture
+import sqlite3
+import base64
+import mmap
 import cairo
+import time
 import os
 from math import pi
 from lollypop.database import Database
 
+class PixbufCache:
+
+	"""
+		LRU cache of pixbufs, max_size is in bytes
+		Can be used from multiple threads
+	"""
+	def __init__(self, max_size):
+		self._lock = Lock()
+		self._pixbufs = OrderedDict()
+		self._size = 0
+		self._max_size = max_size
+		self.hits = 0
+		self.misses = 0
+
+	"""
+		Return pixbuf for key or None
+	"""
+	def get(self, key):
+		with self._lock:
+			pixbuf = self._pixbufs.get(key)
+			if pixbuf is None:
+				self.misses += 1
+			else:
+				self.hits += 1
+				self._pixbufs.move_to_end(key)
+			return pixbuf
+
+	"""
+		Add pixbuf for key, drop least recently used pixbufs if cache is full
+	"""
+	def add(self, key, pixbuf):
+		with self._lock:
+			if key in self._pixbufs:
+				self._size -= self._get_size(self._pixbufs.pop(key))
+			self._pixbufs[key] = pixbuf
+			self._size += self._get_size(pixbuf)
+			while self._size > self._max_size and self._pixbufs:
+				key, old = self._pixbufs.popitem(last=False)
+				self._size -= self._get_size(old)
+
+	"""
+		Remove all pixbufs
+	"""
+	def clear(self):
+		with self._lock:
+			self._pixbufs.clear()
+			self._size = 0
+
+	"""
+		Return (hits, misses, pixbufs count, size in bytes)
+	"""
+	def get_stats(self):
+		with self._lock:
+			return (self.hits, self.misses, len(self._pixbufs), self._size)
+
+#######################
+# PRIVATE             #
+#######################
+
+	"""
+		Return memory used by pixbuf
+	"""
+	def _get_size(self, pixbuf):
+		return pixbuf.get_rowstride() * pixbuf.get_height()
+
+class CoverCache:
+
+	"""
+		Open cover cache index in directory path
+		Cached covers are evicted when they use more than max_size bytes
+		Can be used from multiple threads
+	"""
+	def __init__(self, path, max_size):
+		self._lock = Lock()
+		self._path = path
+		self._max_size = max_size
+		self._sql = sqlite3.connect("%s/covers.db" % path, check_same_thread=False)
+		# Commits do not wait for disk, index is only a cache
+		self._sql.execute("PRAGMA journal_mode=WAL")
+		self._sql.execute("PRAGMA synchronous=NORMAL")
+		self._sql.execute("CREATE TABLE IF NOT EXISTS nocovers (path TEXT PRIMARY KEY, mtime INT NOT NULL)")
+		self._sql.execute('''CREATE TABLE IF NOT EXISTS covers (album_id INT NOT NULL,
+						size INT NOT NULL,
+						source TEXT NOT NULL,
+						mtime INT NOT NULL,
+						bytes INT NOT NULL,
+						atime INT NOT NULL,
+						PRIMARY KEY (album_id, size))''')
+		self._sql.commit()
+		self._nocovers = {}
+		for path, mtime in self._sql.execute("SELECT path, mtime FROM nocovers"):
+			self._nocovers[path] = mtime
+		# [source, mtime, bytes, atime] by (album_id, size), least recently used first
+		self._covers = OrderedDict()
+		self._size = 0
+		for row in self._sql.execute("SELECT album_id, size, source, mtime, bytes, atime FROM covers ORDER BY atime"):
+			self._covers[row[0:2]] = list(row[2:])
+			self._size += row[4]
+
+	"""
+		Return cached cover path for album_id at size
+		arg: int, int
+		ret: string
+	"""
+	def get_path(self, album_id, size):
+		return "%s/%d_%d.jpg" % (self._path, album_id, size)
+
+	"""
+		Return cached cover path for album_id at size if still valid
+		Cover is valid if its source file is in album_path
+		and has not been modified since caching
+		arg: int, int, string
+		ret: string or None
+	"""
+	def get(self, album_id, size, album_path):
+		with self._lock:
+			cover = self._covers.get((album_id, size))
+			if cover is None:
+				return None
+			cover[3] = int(time.time())
+			self._covers.move_to_end((album_id, size))
+		source, mtime = cover[0:2]
+		path = self.get_path(album_id, size)
+		try:
+			if os.path.dirname(source) == album_path and\
+			   int(os.stat(source).st_mtime) == mtime and os.path.exists(path):
+				return path
+		except OSError:
+			pass
+		self.remove(album_id, size)
+		return None
+
+	"""
+		Add cached cover for album_id at size made from source
+		Evict least recently used covers if cache is full
+		arg: int, int, string
+	"""
+	def add(self, album_id, size, source):
+		mtime = int(os.stat(source).st_mtime)
+		length = os.path.getsize(self.get_path(album_id, size))
+		with self._lock:
+			old = self._covers.pop((album_id, size), None)
+			if old:
+				self._size -= old[2]
+			self._covers[(album_id, size)] = [source, mtime, length, int(time.time())]
+			self._size += length
+			self._sql.execute("INSERT OR REPLACE INTO covers (album_id, size, source, mtime, bytes, atime) VALUES (?, ?, ?, ?, ?, ?)",
+					  (album_id, size, source, mtime, length, int(time.time())))
+			self._evict()
+			self._sql.commit()
+
+	"""
+		Remove cached cover for album_id at size
+		arg: int, int
+	"""
+	def remove(self, album_id, size):
+		with self._lock:
+			self._remove(album_id, size)
+			self._sql.commit()
+
+	"""
+		Remove cached covers for albums not in album_ids and unknown files
+		arg: [int]
+	"""
+	def purge(self, album_ids):
+		album_ids = set(album_ids)
+		with self._lock:
+			for album_id, size in list(self._covers.keys()):
+				if album_id not in album_ids:
+					self._remove(album_id, size)
+			self._save_atimes()
+			self._sql.commit()
+			known = set()
+			for album_id, size in self._covers.keys():
+				known.add(os.path.basename(self.get_path(album_id, size)))
+		for f in os.listdir(self._path):
+			if (f.endswith(".jpg") and f not in known) or f.endswith(".tmp"):
+				try:
+					os.remove("%s/%s" % (self._path, f))
+				except OSError:
+					pass
+
+	"""
+		Return True if directory at path was known without cover at mtime
+		arg: string, int
+	"""
+	def has_no_cover(self, path, mtime):
+		with self._lock:
+			return self._nocovers.get(path) == mtime
+
+	"""
+		Remember directory at path has no cover at mtime
+		arg: string, int
+	"""
+	def set_no_cover(self, path, mtime):
+		with self._lock:
+			self._nocovers[path] = mtime
+			self._sql.execute("INSERT OR REPLACE INTO nocovers (path, mtime) VALUES (?, ?)", (path, mtime))
+			self._sql.commit()
+
+#######################
+# PRIVATE             #
+#######################
+
+	"""
+		Remove cover from index and disk, lock must be held
+	"""
+	def _remove(self, album_id, size):
+		cover = self._covers.pop((album_id, size), None)
+		if cover is None:
+			return
+		self._size -= cover[2]
+		self._sql.execute("DELETE FROM covers WHERE album_id=? AND size=?", (album_id, size))
+		try:
+			os.remove(self.get_path(album_id, size))
+		except OSError:
+			pass
+
+	"""
+		Remove least recently used covers until cache fits in max size, lock must be held
+	"""
+	def _evict(self):
+		while self._size > self._max_size and self._covers:
+			self._remove(*next(iter(self._covers)))
+
+	"""
+		Write access times kept in memory to index, lock must be held
+	"""
+	def _save_atimes(self):
+		self._sql.executemany("UPDATE covers SET atime=? WHERE album_id=? AND size=?",
+				      [(cover[3],) + key for key, cover in self._covers.items()])
+
+class ThumbnailAtlas:
+
+	"""
+		Open thumbnail atlas in directory path for thumbnails of size pixels
+		Thumbnails are raw RGB pixels in fixed size slots of a memory mapped file,
+		slots are indexed by album id in covers.db
+		Can be used from multiple threads
+	"""
+	def __init__(self, path, size):
+		self._lock = Lock()
+		self._size = size
+		self._slot_size = size * size * 3
+		self._sql = sqlite3.connect("%s/covers.db" % path, check_same_thread=False)
+		self._sql.execute('''CREATE TABLE IF NOT EXISTS atlas (album_id INT PRIMARY KEY,
+						slot INT NOT NULL,
+						source TEXT NOT NULL,
+						mtime INT NOT NULL)''')
+		self._sql.commit()
+		# [slot, source, mtime] by album_id
+		self._slots = {}
+		for row in self._sql.execute("SELECT album_id, slot, source, mtime FROM atlas"):
+			self._slots[row[0]] = list(row[1:])
+		# Album paths checked against thumbnails source in this session by album_id
+		self._checked = {}
+		self._fd = os.open("%s/atlas.bin" % path, os.O_RDWR | os.O_CREAT)
+		used = set(entry[0] for entry in self._slots.values())
+		self._capacity = max(os.fstat(self._fd).st_size // self._slot_size,
+				     max(used) + 1 if used else 0)
+		# Free slots, lowest last
+		self._free = sorted(set(range(self._capacity)) - used, reverse=True)
+		self._map = None
+		self._resize(max(self._capacity, 256))
+
+	"""
+		Return thumbnail for album_id in album_path, None if missing or outdated
+		Source is only checked once per session, no file access afterwards
+		arg: int, string
+		ret: GdkPixbuf.Pixbuf or None
+	"""
+	def get(self, album_id, album_path):
+		with self._lock:
+			entry = self._slots.get(album_id)
+			if entry is None:
+				return None
+			checked = self._checked.get(album_id) == album_path
+		if not checked:
+			source, mtime = entry[1:]
+			try:
+				valid = os.path.dirname(source) == album_path and\
+					int(os.stat(source).st_mtime) == mtime
+			except OSError:
+				valid = False
+			if not valid:
+				self.remove(album_id)
+				return None
+		with self._lock:
+			if self._slots.get(album_id) is not entry:
+				return None
+			self._checked[album_id] = album_path
+			offset = entry[0] * self._slot_size
+			data = GLib.Bytes.new(self._map[offset:offset + self._slot_size])
+		return GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB, False, 8,
+						       self._size, self._size, self._size * 3)
+
+	"""
+		Store pixbuf as thumbnail for album_id made from source
+		arg: int, GdkPixbuf.Pixbuf, string
+	"""
+	def add(self, album_id, pixbuf, source):
+		# Flatten on white to get packed RGB rows
+		thumbnail = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB, False, 8,
+						 self._size, self._size)
+		thumbnail.fill(0xffffffff)
+		pixbuf.composite(thumbnail, 0, 0, self._size, self._size, 0, 0,
+				 self._size / pixbuf.get_width(), self._size / pixbuf.get_height(),
+				 GdkPixbuf.InterpType.BILINEAR, 255)
+		pixels = thumbnail.get_pixels()
+		mtime = int(os.stat(source).st_mtime)
+		with self._lock:
+			entry = self._slots.get(album_id)
+			if entry:
+				slot = entry[0]
+			else:
+				if not self._free:
+					self._resize(self._capacity * 2)
+				slot = self._free.pop()
+			offset = slot * self._slot_size
+			self._map[offset:offset + self._slot_size] = pixels
+			self._slots[album_id] = [slot, source, mtime]
+			self._checked[album_id] = os.path.dirname(source)
+			self._sql.execute("INSERT OR REPLACE INTO atlas (album_id, slot, source, mtime) VALUES (?, ?, ?, ?)",
+					  (album_id, slot, source, mtime))
+			self._sql.commit()
+
+	"""
+		Remove thumbnail for album_id
+		arg: int
+	"""
+	def remove(self, album_id):
+		with self._lock:
+			self._remove(album_id)
+			self._sql.commit()
+
+	"""
+		Remove thumbnails for albums not in album_ids
+		Check remaining thumbnails against their source again, album ids may have been reused
+		arg: [int]
+	"""
+	def purge(self, album_ids):
+		album_ids = set(album_ids)
+		with self._lock:
+			for album_id in list(self._slots.keys()):
+				if album_id not in album_ids:
+					self._remove(album_id)
+			self._checked.clear()
+			self._sql.commit()
+
+#######################
+# PRIVATE             #
+#######################
+
+	"""
+		Remove thumbnail from index, lock must be held
+	"""
+	def _remove(self, album_id):
+		entry = self._slots.pop(album_id, None)
+		if entry is None:
+			return
+		self._checked.pop(album_id, None)
+		self._free.append(entry[0])
+		self._free.sort(reverse=True)
+		self._sql.execute("DELETE FROM atlas WHERE album_id=?", (album_id,))
+
+	"""
+		Grow atlas file to capacity slots and map it again, lock must be held
+	"""
+	def _resize(self, capacity):
+		if self._map is not None:
+			self._map.close()
+		if capacity > self._capacity:
+			self._free = list(range(capacity - 1, self._capacity - 1, -1)) + self._free
+			self._capacity = capacity
+		os.ftruncate(self._fd, self._capacity * self._slot_size)
+		self._map = mmap.mmap(self._fd, self._capacity * self._slot_size)
+
 class AlbumArt: 
 
 	_mimes = [ "jpeg", "jpg", "png", "gif" ]
+	# Audio files that may embed a cover
+	_audio_mimes = [ "mp3", "ogg", "flac", "m4a", "mp4" ]
 	_ART_SIZE = 200
 	_ART_SMALL_SIZE = 48
+	# Cached sizes, largest first
+	_SIZES = [ _ART_SIZE, _ART_SMALL_SIZE ]
 	CACHE_PATH = os.path.expanduser ("~") +  "/.cache/lollypop"
+	# Pixbufs by (album_id, size), shared by all instances
+	_pixbufs = None
+	# Album paths by album id, shared by all instances
+	_paths = {}
+	# Decoding threads, shared by all instances
+	_executor = None
+	# Persistent cover cache index, shared by all instances
+	_covers = None
+	# Default arts by size, shared by all instances
+	_default_arts = {}
+	# Small covers atlas if enabled by cover-atlas setting, shared by all instances
+	_atlas = None
+	# [future, [(callback, args)], load] of covers being decoded by album id,
+	# shared by all instances
+	_jobs = {}
+	_jobs_lock = Lock()
 	
 	"""
 		Create cache path
+		Create shared pixbuf cache limited by cover-cache-size setting
+		Open shared cover cache index limited by cover-cache-disk-size setting
+		Open shared small covers atlas if cover-atlas setting is set
 	"""	
 	def __init__(self, db):
 		self._db = db
+		if AlbumArt._pixbufs is None:
+			settings = Gio.Settings.new('org.gnome.Lollypop')
+			AlbumArt._pixbufs = PixbufCache(settings.get_int('cover-cache-size') * 1024)
+			AlbumArt._executor = ThreadPoolExecutor(cpu_count())
 
 		if not os.path.exists(self.CACHE_PATH):
 			try:
@@ -37,74 +451,283 @@ class AlbumArt:
 			except:
 				print("Can't create %s" % self.CACHE_PATH)
 
+		if AlbumArt._covers is None:
+			settings = Gio.Settings.new('org.gnome.Lollypop')
+			AlbumArt._covers = CoverCache(self.CACHE_PATH, settings.get_int('cover-cache-disk-size') * 1024 * 1024)
+			if settings.get_boolean('cover-atlas'):
+				try:
+					AlbumArt._atlas = ThumbnailAtlas(self.CACHE_PATH, self._ART_SMALL_SIZE)
+				except Exception as e:
+					print("AlbumArt::__init__(): %s" % e)
+
 	"""
-		get cover cache path for album_id
+		get cover cache path for album_id, cover is cached if needed
 	"""
 	def get_path(self, album_id):
-		album_path = self._db.get_album_path_by_id(album_id)
-		return "%s/%s.jpg" % (self.CACHE_PATH, album_path.replace("/", "_"))
+		path = self._covers.get_path(album_id, self._ART_SIZE)
+		if not os.path.exists(path):
+			self._load(album_id, self._get_album_path(album_id), self._ART_SIZE)
+		return path
 	
 	"""
 		Return pixbuf for album_id
 	"""
 	def get(self, album_id):
-		album_path = self._db.get_album_path_by_id(album_id)
-		cache_path = "%s/%s.jpg" % (self.CACHE_PATH, album_path.replace("/", "_"))
-		cached = True
-		try:
-			if not os.path.exists(cache_path):
-				path = self._get_art_path(album_path)
-				if path:
-					pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale (path,
-																	  self._ART_SIZE, self._ART_SIZE, False)
-					pixbuf.savev(cache_path, "jpeg", ["quality"], ["90"])
-				else:
-					pixbuf = self._get_default_art()
-			else:
-				pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size (cache_path,
-																 self._ART_SIZE, self._ART_SIZE)
+		pixbuf = self._get(album_id, self._ART_SIZE)
+		if pixbuf:
 			return pixbuf
-			
-		except Exception as e:
-			print(e)
-			return self._get_default_art()			
+		else:
+			return self._get_default_art()
+
+	"""
+		Return pixbuf for album_id now if cached, else return default art
+		and call callback(pixbuf, *args) in main loop once decoded in a thread
+		If album cover is already being decoded, wait for it
+		Callback is not called if album has no cover
+	"""
+	def get_async(self, album_id, callback, *args):
+		pixbuf = self._pixbufs.get((album_id, self._ART_SIZE))
+		if pixbuf:
+			return pixbuf
+		album_path = self._get_album_path(album_id)
+		with self._jobs_lock:
+			job = self._jobs.get(album_id)
+			if job is None or job[0].cancelled():
+				job = self._submit(album_id, album_path, True)
+			job[1].append((callback, args))
+		return self._get_default_art()
+
+	"""
+		Do not call callback for album_id anymore
+		Cancel decoding if nobody waits for it and it has not started
+	"""
+	def cancel_async(self, album_id, callback):
+		with self._jobs_lock:
+			job = self._jobs.get(album_id)
+			if job is None:
+				return
+			job[1] = [waiting for waiting in job[1] if waiting[0] != callback]
+			# Scan jobs are not cancelled here
+			if not job[1] and job[2] and job[0].cancel():
+				del self._jobs[album_id]
 
 	"""
 		Return small pixbuf for album_id
 	"""
 	def get_small(self, album_id):
-		album_path = self._db.get_album_path_by_id(album_id)
-		cache_path = "%s/%s_small.jpg" % (self.CACHE_PATH, album_path.replace("/", "_"))
-		cached = True
+		return self._get(album_id, self._ART_SMALL_SIZE)
+
+	"""
+		Make covers at every size for albums missing in disk cache
+		Each album cover is decoded once, albums are handled in parallel
+		Albums already being decoded are skipped
+		arg: [int]
+		ret: [concurrent.futures.Future], one per album
+	"""
+	def cache_covers(self, album_ids):
+		paths = {}
+		for album_id in album_ids:
+			# Album ids may have been reused by a scan, do not trust shared paths
+			paths[album_id] = self._db.get_album_path_by_id(album_id)
+			self._paths[album_id] = paths[album_id]
+		futures = []
+		with self._jobs_lock:
+			for album_id, album_path in paths.items():
+				job = self._jobs.get(album_id)
+				if job is None or job[0].cancelled():
+					futures.append(self._submit(album_id, album_path, False)[0])
+		return futures
+
+	"""
+		Forget cached pixbufs and album paths, album ids may have changed
+		Remove cached covers for albums not in db anymore
+	"""
+	def clear_cache(self):
+		self._pixbufs.clear()
+		self._paths.clear()
+		album_ids = self._db.get_all_albums_ids()
+		self._covers.purge(album_ids)
+		if self._atlas:
+			self._atlas.purge(album_ids)
+
+	"""
+		Return shared cache stats as (hits, misses, pixbufs count, size in bytes)
+	"""
+	def get_cache_stats(self):
+		return self._pixbufs.get_stats()
+
+#######################
+# PRIVATE             #
+#######################
+
+	"""
+		Return pixbuf for album_id at size, None if album has no cover
+	"""
+	def _get(self, album_id, size):
+		pixbuf = self._pixbufs.get((album_id, size))
+		if pixbuf is None:
+			pixbuf = self._load(album_id, self._get_album_path(album_id), size)
+		return pixbuf
+
+	"""
+		Load pixbuf for album in album_path at size and add it to shared cache
+		Make covers at every size if missing or outdated
+		No Gtk calls, may be run in a thread
+		Return None if album has no cover
+	"""
+	def _load(self, album_id, album_path, size):
 		try:
-			if not os.path.exists(cache_path):
-				path = self._get_art_path(album_path)
-				if path:
-					pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale (self._get_art_path(album_path), 												  self._ART_SMALL_SIZE,
-											  self._ART_SMALL_SIZE, False)
-					pixbuf.savev(cache_path, "jpeg", ["quality"], ["90"])
-				else:
-					pixbuf = None
+			pixbuf = None
+			if self._in_atlas(size):
+				pixbuf = self._atlas.get(album_id, album_path)
 			else:
-				pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size (cache_path, self._ART_SMALL_SIZE,
-											     self._ART_SMALL_SIZE)
-			return pixbuf
-			
+				cache_path = self._covers.get(album_id, size, album_path)
+				if cache_path:
+					try:
+						pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size (cache_path,
+												 size, size)
+					# Broken cached cover, make it again
+					except Exception as e:
+						print("AlbumArt::_load(): %s" % e)
+						self._covers.remove(album_id, size)
+			if pixbuf:
+				self._pixbufs.add((album_id, size), pixbuf)
+				return pixbuf
+			else:
+				return self._make_covers(album_id, album_path).get(size)
 		except Exception as e:
-			print(e)
+			print("AlbumArt::_load(): %s" % e)
 			return None
 
-#######################
-# PRIVATE             #
-#######################
+	"""
+		Decode album cover in album_path once, save it to cover cache at every size
+		and add pixbufs to shared cache if memory
+		If there is no cover file, use cover embedded in first audio file
+		Directories without cover are remembered until their mtime
+		or mtime of their first audio file change
+		No Gtk calls, may be run in a thread
+		Return {size: pixbuf}, empty if album has no cover
+	"""
+	def _make_covers(self, album_id, album_path, memory=True):
+		pixbufs = {}
+		# Do not look again in directories without cover
+		# Taggers embed covers in place, directory mtime does not change
+		mtime = int(os.stat(album_path).st_mtime)
+		audio_path = self._get_audio_file(album_path)
+		if audio_path:
+			mtime = max(mtime, int(os.stat(audio_path).st_mtime))
+		if self._covers.has_no_cover(album_path, mtime):
+			return pixbufs
+		path = self._get_art_path(album_path)
+		if path:
+			pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_scale (path,
+									  self._SIZES[0], self._SIZES[0], False)
+		else:
+			path = audio_path
+			pixbuf = None
+			if path:
+				pixbuf = self._get_embedded_art(path)
+			if pixbuf is None:
+				self._covers.set_no_cover(album_path, mtime)
+				return pixbufs
+			pixbuf = pixbuf.scale_simple(self._SIZES[0], self._SIZES[0], GdkPixbuf.InterpType.BILINEAR)
+		for size in self._SIZES:
+			if size != self._SIZES[0]:
+				pixbuf = pixbuf.scale_simple(size, size, GdkPixbuf.InterpType.BILINEAR)
+			if self._in_atlas(size):
+				self._atlas.add(album_id, pixbuf, path)
+			else:
+				# Others threads may make same cover, never expose a partial file
+				cache_path = self._covers.get_path(album_id, size)
+				tmp_path = "%s.%d.tmp" % (cache_path, get_ident())
+				pixbuf.savev(tmp_path, "jpeg", ["quality"], ["90"])
+				os.replace(tmp_path, cache_path)
+				self._covers.add(album_id, size, path)
+			if memory:
+				self._pixbufs.add((album_id, size), pixbuf)
+			pixbufs[size] = pixbuf
+		return pixbufs
+
+	"""
+		Make covers for album in album_path if missing in disk cache
+		Shared pixbufs cache is left untouched
+		No Gtk calls, run in a thread
+	"""
+	def _cache_covers(self, album_id, album_path):
+		for size in self._SIZES:
+			if self._in_atlas(size):
+				cached = self._atlas.get(album_id, album_path)
+			else:
+				cached = self._covers.get(album_id, size, album_path)
+			if not cached:
+				try:
+					self._make_covers(album_id, album_path, False)
+				except Exception as e:
+					print("AlbumArt::_cache_covers(): %s" % e)
+				return
+
+	"""
+		True if covers at size are stored in atlas
+	"""
+	def _in_atlas(self, size):
+		return self._atlas is not None and size == self._ART_SMALL_SIZE
+
+	"""
+		Submit decoding of album cover, jobs lock must be held
+		Load cover in shared cache if load, else only make disk cache
+		ret: job
+	"""
+	def _submit(self, album_id, album_path, load):
+		future = self._executor.submit(self._run_job, album_id, album_path, load)
+		job = [future, [], load]
+		self._jobs[album_id] = job
+		return job
+
+	"""
+		Decode album cover in a thread and pass it to waiting callbacks in main loop
+	"""
+	def _run_job(self, album_id, album_path, load):
+		pixbuf = None
+		if load:
+			pixbuf = self._load(album_id, album_path, self._ART_SIZE)
+		else:
+			self._cache_covers(album_id, album_path)
+		with self._jobs_lock:
+			waiting = self._jobs.pop(album_id)[1]
+		# Callbacks added while making disk cache
+		if waiting and not load:
+			pixbuf = self._load(album_id, album_path, self._ART_SIZE)
+		if pixbuf:
+			for callback, args in waiting:
+				GLib.idle_add(callback, pixbuf, *args)
 
 	"""
-		Return pixbuf for default album
+		Return album path for album_id
 	"""
-	def _get_default_art(self):
+	def _get_album_path(self, album_id):
+		album_path = self._paths.get(album_id)
+		if album_path is None:
+			album_path = self._db.get_album_path_by_id(album_id)
+			self._paths[album_id] = album_path
+		return album_path
+
+	"""
+		Return pixbuf for default album, built once per size
+	"""
+	def _get_default_art(self, size=_ART_SIZE):
+		pixbuf = self._default_arts.get(size)
+		if pixbuf is None:
+			pixbuf = self._make_default_art(size)
+			self._default_arts[size] = pixbuf
+		return pixbuf
+
+	"""
+		Make pixbuf for default album
+	"""
+	def _make_default_art(self, size):
 		# get a small pixbuf with the given path
 		icon = Gtk.IconTheme.get_default().load_icon('folder-music-symbolic', 
-							     max(self._ART_SIZE, self._ART_SIZE) / 4, 0)
+							     size / 4, 0)
 
 		# create an empty pixbuf with the requested size
 		result = GdkPixbuf.Pixbuf.new(icon.get_colorspace(),
@@ -143,6 +766,60 @@ class AlbumArt:
 		except:
 		    pass
 
+	"""
+		Return path of first audio file in dir, None if there is none
+		Only this file is looked at for embedded cover,
+		albums are expected to embed the same cover in all tracks
+	"""
+	def _get_audio_file(self, dir):
+		for file in sorted(os.listdir(dir)):
+			lowername = file.lower()
+			for mime in self._audio_mimes:
+				if lowername.endswith(mime):
+					return "%s/%s" % (dir, file)
+		return None
+
+	"""
+		Return pixbuf for cover embedded in audio file at filepath
+		Return None if there is no embedded cover
+		No Gtk calls, may be run in a thread
+	"""
+	def _get_embedded_art(self, filepath):
+		try:
+			data = self._get_picture_data(filepath)
+			if data:
+				loader = GdkPixbuf.PixbufLoader()
+				loader.write(data)
+				loader.close()
+				return loader.get_pixbuf()
+		except Exception as e:
+			print("AlbumArt::_get_embedded_art(): %s" % e)
+		return None
+
+	"""
+		Return data of first picture embedded in audio file at filepath
+		Handle FLAC picture blocks, ID3 APIC frames, MP4 covr atoms
+		and Vorbis comments picture blocks
+		arg: string
+		ret: bytes or None
+	"""
+	def _get_picture_data(self, filepath):
+		tags = mutagen.File(filepath)
+		if tags is None:
+			return None
+		if getattr(tags, "pictures", None):
+			return tags.pictures[0].data
+		if tags.tags is None:
+			return None
+		for key in tags.tags.keys():
+			if key.startswith("APIC"):
+				return tags.tags[key].data
+			elif key == "covr" and tags.tags[key]:
+				return bytes(tags.tags[key][0])
+			elif key.lower() == "metadata_block_picture":
+				return Picture(base64.b64decode(tags.tags[key][0])).data
+		return None
+
 	"""
 		Make an icon frame on pixbuf
 	"""
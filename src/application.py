@@ -12,7 +12,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 # Many code inspiration from gnome-music at the GNOME project
 
-from gi.repository import Gtk, Gio, GLib, Gdk, Notify
+from gi.repository import Gtk, Gio, GLib, Gdk, GObject, Notify
 from gettext import gettext as _
 from lollypop.window import Window
 from lollypop.database import Database
@@ -31,6 +31,8 @@ class Application(Gtk.Application):
 					 flags=Gio.ApplicationFlags.FLAGS_NONE)
 		GLib.set_application_name(_("Lollypop"))
 		GLib.set_prgname('lollypop')
+		# Collection scanner runs in a thread
+		GObject.threads_init()
 
 		cssProviderFile = Gio.File.new_for_uri('resource:///org/gnome/Lollypop/application.css')
 		cssProvider = Gtk.CssProvider()
@@ -104,6 +106,7 @@ class Application(Gtk.Application):
 			self._window = Window(self, self._db, self._player)
 			self._service = MediaPlayer2Service(self._db, self._player)
 			self._notifications = NotificationManager(self._player, self._db)
+			GLib.idle_add(self._player.restore_state)
 
 		self._window.present()
 
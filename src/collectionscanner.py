@@ -15,23 +15,72 @@
 import os, time
 import sqlite3
 from gettext import gettext as _, ngettext    
-from gi.repository import GLib, Gdk
+from gi.repository import GLib, Gdk, Gio, GObject
+from threading import Thread
+from concurrent.futures import as_completed
 import mutagen
+from multiprocessing import get_context, cpu_count
 from lollypop.database import Database
+from lollypop.albumart import AlbumArt
 from lollypop.utils import format_artist_name
 
-class CollectionScanner:
+class ScanStage:
+    TAGS = 0
+    COVERS = 1
+
+class CollectionScanner(GObject.GObject):
+
+	__gsignals__ = {
+		'scan-progress': (GObject.SIGNAL_RUN_FIRST, None, (int, int, int, int, int)),
+	}
 
 	_mimes = [ "mp3", "ogg", "flac", "m4a", "mp4" ]
+	# Minimal delay between two progress notifications in seconds
+	_PROGRESS_DELAY = 0.25
+	# Tracks written to db per transaction
+	_BATCH_SIZE = 1000
+
 	def __init__(self):
+		GObject.GObject.__init__(self)
 		self._path = GLib.get_user_special_dir(GLib.USER_DIRECTORY_MUSIC)
+		self._thread = None
+		self._stop = False
+		self._progress_time = 0
+		self._artists = None
+		self._genres = None
+		self._albums = None
+		self._batch = []
+		self._new_albums = set()
 
 	"""
-		Update database if empty
-		Call callback with new genres items []
+		Update database in a background thread
+		Then cache covers of new albums if scan-covers setting is on
+		Emit "scan-progress" with scan stage, files seen, items done, items to do and eta in seconds (-1 if unknown)
+		Call callback with new genres items [] in main loop
 	"""
 	def update(self, callback):
-		GLib.idle_add(self._scan, callback)
+		if self.is_running():
+			return
+		self._stop = False
+		self._thread = Thread(target=self._scan, args=(callback,))
+		self._thread.daemon = True
+		self._thread.start()
+
+	"""
+		Return True if a scan is running
+	"""
+	def is_running(self):
+		return self._thread is not None and self._thread.is_alive()
+
+	"""
+		Cancel running scan and wait for it to finish
+		Files already read are kept in database, callback is not called
+	"""
+	def stop(self):
+		self._stop = True
+		if self._thread:
+			self._thread.join()
+			self._thread = None
 
 #######################
 # PRIVATE             #
@@ -39,12 +88,21 @@ class CollectionScanner:
 
 	"""
 		Scan music collection for music files
+		Only new files or files modified since last scan are read,
+		tags are read by a pool of worker processes
+		Modified and deleted files are removed in one pass
 		Call callback with new genres items []
 	"""
 	def _scan(self, callback):
 		db = Database()
-		tracks = db.get_tracks_filepath()
+		tracks = db.get_tracks_mtime()
+		new_tracks = []
+		removed = []
+		seen = 0
 		for root, dirs, files in os.walk(self._path):
+			if self._stop:
+				db.close()
+				return
 			for f in files:
 				lowername = f.lower()
 				supported = False
@@ -53,30 +111,149 @@ class CollectionScanner:
 						supported = True
 						break	
 				if (supported):
+					seen += 1
 					filepath = os.path.join(root, f)
 					try:
-						if filepath not in tracks:
-							tag = mutagen.File(filepath, easy = True)
-							self._add2db(db, filepath, tag)
-						else:
-							tracks.remove(filepath)
-						
+						stat = os.stat(filepath)
+						mtime = int(stat.st_mtime)
+						size = stat.st_size
+						if filepath in tracks:
+							track_id, track_mtime, track_size = tracks.pop(filepath)
+							# Unchanged since last scan, keep it
+							if (track_mtime, track_size) == (mtime, size):
+								continue
+							removed.append(track_id)
+						new_tracks.append((filepath, mtime, size))
 					except Exception as e:
 						print("CollectionScanner::_scan(): %s" %e)
+			self._notify_progress(ScanStage.TAGS, seen, 0, len(new_tracks), -1)
 
-		# Clean deleted files
-		for track in tracks:
-			db.remove_track(track)
+		# Clean deleted files, tracks now only contains files not found on disk
+		removed += [track[0] for track in tracks.values()]
+		db.remove_tracks(removed)
+		db.commit()
+
+		if new_tracks:
+			# Name to rowid caches used by _add2db()
+			self._artists = db.get_artists_ids()
+			self._genres = db.get_genres_ids()
+			self._albums = db.get_albums_ids()
+			# Do not fork a process running Gtk and scanner threads,
+			# workers are started by a clean forkserver process
+			context = get_context("forkserver")
+			context.set_forkserver_preload(["lollypop.collectionscanner"])
+			pool = context.Pool(cpu_count())
+			start = time.time()
+			parsed = 0
+			for infos in pool.imap_unordered(_get_track_infos, new_tracks, 16):
+				if self._stop:
+					break
+				if infos:
+					self._batch.append(infos)
+					if len(self._batch) >= self._BATCH_SIZE:
+						self._flush(db)
+				parsed += 1
+				elapsed = time.time() - start
+				eta = int(elapsed / parsed * (len(new_tracks) - parsed))
+				self._notify_progress(ScanStage.TAGS, seen, parsed, len(new_tracks), eta)
+			if self._stop:
+				pool.terminate()
+			else:
+				pool.close()
+			pool.join()
+			self._flush(db)
+			self._artists = self._genres = self._albums = None
 
 		db.commit()
-		db.clean()
-		callback(db.get_all_genres())
+		if not self._stop:
+			db.clean()
+			settings = Gio.Settings.new('org.gnome.Lollypop')
+			if settings.get_boolean('scan-covers'):
+				self._cache_covers(db, seen)
+		if not self._stop:
+			GLib.idle_add(callback, db.get_all_genres())
+		self._new_albums = set()
 		db.close()
 
 	"""
-		Add new file to db with tag
+		Cache covers for albums added or modified by scan, in parallel
+		Albums removed by db.clean() are skipped
+	"""
+	def _cache_covers(self, db, seen):
+		album_ids = self._new_albums & set(db.get_all_albums_ids())
+		if not album_ids:
+			return
+		futures = AlbumArt(db).cache_covers(album_ids)
+		start = time.time()
+		done = 0
+		for future in as_completed(futures):
+			if self._stop:
+				for future in futures:
+					future.cancel()
+				break
+			done += 1
+			elapsed = time.time() - start
+			eta = int(elapsed / done * (len(futures) - done))
+			self._notify_progress(ScanStage.COVERS, seen, done, len(futures), eta)
+
+	"""
+		Emit "scan-progress" in main loop, at most every _PROGRESS_DELAY seconds
+	"""
+	def _notify_progress(self, stage, seen, done, total, eta):
+		now = time.time()
+		if now - self._progress_time > self._PROGRESS_DELAY:
+			self._progress_time = now
+			GLib.idle_add(self.emit, "scan-progress", stage, seen, done, total, eta)
+
+	"""
+		Write pending tracks to db and commit
+		Write transaction only lasts while writing, not while waiting for workers,
+		so main loop writes are not blocked during scan
+	"""
+	def _flush(self, db):
+		tracks = []
+		for infos in self._batch:
+			tracks.append(self._add2db(db, *infos))
+		db.add_tracks(tracks)
+		db.commit()
+		self._batch = []
+
+	"""
+		Add artist, genre and album of file with tags infos to db if missing
+		Artists, genres and albums ids are looked up in scan caches
+		ret: track row for db.add_tracks()
 	"""
-	def _add2db(self, db, filepath, tag):
+	def _add2db(self, db, filepath, mtime, size, title, artist, album, genre, length, tracknumber, year):
+		# Get artist id, add it if missing
+		artist_id = self._artists.get(artist)
+		if artist_id is None:
+			artist_id = db.add_artist(artist)
+			self._artists[artist] = artist_id
+
+		# Get genre id, add genre if missing
+		genre_id = self._genres.get(genre)
+		if genre_id is None:
+			genre_id = db.add_genre(genre)
+			self._genres[genre] = genre_id
+
+		# Get album id, add it if missing
+		album_id = self._albums.get((album, artist_id, genre_id))
+		if album_id is None:
+			album_id = db.add_album(album, artist_id, genre_id, year)
+			self._albums[(album, artist_id, genre_id)] = album_id
+		self._new_albums.add(album_id)
+
+		return (title, filepath, length, tracknumber, album_id, mtime, size)
+
+"""
+	Read tags for file, run in a worker process
+	arg: (string, int, int)
+	ret: (string, int, int, string, string, string, string, int, int, int) or None
+"""
+def _get_track_infos(args):
+	filepath, mtime, size = args
+	try:
+		tag = mutagen.File(filepath, easy = True)
 		keys = tag.keys()
 		if "title" in keys:
 			title = tag["title"][0]
@@ -127,23 +304,7 @@ class CollectionScanner:
 			year = 0
 		if not year: year = 0
 
-		# Get artist id, add it if missing
-		artist_id = db.get_artist_id_by_name(artist)
-		if artist_id == -1:
-			db.add_artist(artist)
-			artist_id = db.get_artist_id_by_name(artist)
-
-		# Get genre id, add genre if missing
-		genre_id = db.get_genre_id_by_name(genre)
-		if genre_id == -1:
-			db.add_genre(genre)
-			genre_id = db.get_genre_id_by_name(genre)
-
-		# Get album id, add it if missing
-		album_id = db.get_album_id(album, artist_id, genre_id)
-		if album_id == -1:
-			db.add_album(album, artist_id, genre_id, int(year))
-			album_id = db.get_album_id(album, artist_id, genre_id)
-
-		# Add track to db
-		db.add_track(title, filepath, length, tracknumber, album_id)
+		return (filepath, mtime, size, title, artist, album, genre, length, tracknumber, int(year))
+	except Exception as e:
+		print("CollectionScanner::_get_track_infos(): %s" %e)
+		return None
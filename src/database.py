@@ -13,6 +13,7 @@
 # Many code inspiration from gnome-music at the GNOME project
 
 from gettext import gettext as _
+from gi.repository import Gio
 import sqlite3
 import os
 
@@ -33,8 +34,18 @@ class Database:
 						filepath TEXT NOT NULL,
 						length INT,
 						tracknumber INT,
-						album_id INT NOT NULL)'''
-#	create_sort_index = '''CREATE INDEX index_name ON table_name(tracknumber ASC)'''
+						album_id INT NOT NULL,
+						mtime INT NOT NULL DEFAULT 0,
+						size INT NOT NULL DEFAULT 0)'''
+	create_indexes = [ '''CREATE INDEX IF NOT EXISTS idx_tracks_album_id ON tracks(album_id, tracknumber)''',
+			   '''CREATE INDEX IF NOT EXISTS idx_tracks_filepath ON tracks(filepath)''',
+			   '''CREATE INDEX IF NOT EXISTS idx_albums_artist_id ON albums(artist_id, year)''',
+			   '''CREATE INDEX IF NOT EXISTS idx_albums_genre_id ON albums(genre_id)''',
+			   '''CREATE INDEX IF NOT EXISTS idx_artists_name ON artists(name)''',
+			   '''CREATE INDEX IF NOT EXISTS idx_genres_name ON genres(name)''' ]
+
+	# Full text index over name column of a table, with prefix indexes for search as you type
+	create_fts = '''CREATE VIRTUAL TABLE %s_fts USING fts5(name, content='%s', prefix='2 3')'''
 							   
 	def __init__(self):
 		# Create db directory if missing
@@ -46,29 +57,17 @@ class Database:
 				
 		try:
 			self._sql = sqlite3.connect(self.DB_PATH)
-
-			# Create db schema
-			try:
-				self._sql.execute(self.create_albums)
-				self._sql.execute(self.create_artists)
-				self._sql.execute(self.create_genres)
-				self._sql.execute(self.create_tracks)
-#				self._sql.execute(self.create_sort_index)
-				self._sql.commit()
-			except:
-				#TODO: REMOVE ME => Add year to album table
-				try:
-					self._sql.execute('''SELECT year from albums''')
-				except:
-					self._sql.execute('''DROP TABLE albums''')
-					self._sql.execute('''DROP TABLE tracks''')
-					self._sql.execute(self.create_albums)
-					self._sql.execute(self.create_tracks)
-					self.commit()
-				
 		except Exception as e:
 			print("Can't connect to %s" % self.DB_PATH)
-			pass
+			return
+
+		self._fts = False
+		try:
+			self._set_pragmas()
+			self._upgrade()
+			self._fts = "tracks_fts" in self._get_tables()
+		except Exception as e:
+			print("Database::__init__(): %s" % e)
 
 	def close(self):
 		self._sql.close()
@@ -106,30 +105,57 @@ class Database:
 	"""
 		Add a new album to database
 		arg: string, int, int, int
+		ret: int
 	"""
 	def add_album(self, name, artist_id, genre_id, year):
-		self._sql.execute("INSERT INTO albums (name, artist_id, genre_id, year, popularity) VALUES (?, ?, ?, ?, ?)",  (name, artist_id, genre_id, year, 0))
+		result = self._sql.execute("INSERT INTO albums (name, artist_id, genre_id, year, popularity) VALUES (?, ?, ?, ?, ?)",  (name, artist_id, genre_id, year, 0))
+		return result.lastrowid
 
 	"""
 		Add a new artist to database
 		arg: string
+		ret: int
 	"""
 	def add_artist(self, name):
-		self._sql.execute("INSERT INTO artists (name) VALUES (?)", (name,))
+		result = self._sql.execute("INSERT INTO artists (name) VALUES (?)", (name,))
+		return result.lastrowid
 
 	"""
 		Add a new genre to database
 		arg: string
+		ret: int
 	"""
 	def add_genre(self, name):
-		self._sql.execute("INSERT INTO genres (name) VALUES (?)", (name,))
+		result = self._sql.execute("INSERT INTO genres (name) VALUES (?)", (name,))
+		return result.lastrowid
 
 	"""
 		Add a new track to database
-		arg: string, string, int, int, int
+		arg: string, string, int, int, int, int, int
+	"""
+	def add_track(self, name, filepath, length, tracknumber, album_id, mtime, size):
+		self._sql.execute("INSERT INTO tracks (name, filepath, length, tracknumber, album_id, mtime, size) VALUES (?, ?, ?, ?, ?, ?, ?)", (name, filepath, length, tracknumber, album_id, mtime, size))
+
+	"""
+		Add new tracks to database in one statement
+		arg: [(string, string, int, int, int, int, int)]
+	"""
+	def add_tracks(self, tracks):
+		self._sql.executemany("INSERT INTO tracks (name, filepath, length, tracknumber, album_id, mtime, size) VALUES (?, ?, ?, ?, ?, ?, ?)", tracks)
+
+	"""
+		Remove track with filepath from database
+		arg: string
+	"""
+	def remove_track(self, filepath):
+		self._sql.execute("DELETE FROM tracks WHERE filepath=?", (filepath,))
+
 	"""
-	def add_track(self, name, filepath, length, tracknumber, album_id):
-		self._sql.execute("INSERT INTO tracks (name, filepath, length, tracknumber, album_id) VALUES (?, ?, ?, ?, ?)", (name, filepath, length, tracknumber, album_id))
+		Remove tracks with rowids from database
+		arg: [int]
+	"""
+	def remove_tracks(self, track_ids):
+		self._sql.executemany("DELETE FROM tracks WHERE rowid=?", [(track_id,) for track_id in track_ids])
 
 	"""
 		Increment popularity field for album id
@@ -185,6 +211,17 @@ class Database:
 		else:
 			return _("Unknown")
 
+	"""
+		Get all genres rowid by name
+		ret: {string: int}
+	"""
+	def get_genres_ids(self):
+		genres = {}
+		result = self._sql.execute("SELECT name, rowid FROM genres")
+		for row in result:
+			genres[row[0]] = row[1]
+		return genres
+
 	"""
 		Get all availables genres
 		ret: [(int, string)]
@@ -211,6 +248,17 @@ class Database:
 		else:
 			return -1
 
+	"""
+		Get all artists rowid by name
+		ret: {string: int}
+	"""
+	def get_artists_ids(self):
+		artists = {}
+		result = self._sql.execute("SELECT name, rowid FROM artists")
+		for row in result:
+			artists[row[0]] = row[1]
+		return artists
+
 	"""
 		Get artist name by id
 		arg: int
@@ -287,6 +335,17 @@ class Database:
 		else:
 			return -1
 
+	"""
+		Get all albums rowid by name, artist rowid and genre id
+		ret: {(string, int, int): int}
+	"""
+	def get_albums_ids(self):
+		albums = {}
+		result = self._sql.execute("SELECT name, artist_id, genre_id, rowid FROM albums")
+		for row in result:
+			albums[row[0:3]] = row[3]
+		return albums
+
 	"""
 		Get album rowid for track id
 		arg: int
@@ -367,6 +426,16 @@ class Database:
 			albums += row
 		return albums
 	
+	"""
+		Get popularity of all albums
+		ret: {int: int}
+	"""
+	def get_albums_popularity(self):
+		popularity = {}
+		for album_id, pop in self._sql.execute("SELECT rowid, popularity FROM albums"):
+			popularity[album_id] = pop
+		return popularity
+
 	"""
 		Get all albums ids
 		ret: [int]
@@ -502,6 +571,24 @@ class Database:
 			tracks += row
 		return tracks
 
+	"""
+		Get tracks ids for albums ids, ordered by tracknumber
+		Albums without tracks are missing from result
+		arg: [int]
+		ret: {int: [int]}
+	"""
+	def get_tracks_ids_by_albums_ids(self, album_ids):
+		tracks = {}
+		album_ids = list(set(album_ids))
+		# Stay under sqlite host parameters limit
+		for i in range(0, len(album_ids), 500):
+			chunk = album_ids[i:i+500]
+			result = self._sql.execute("SELECT album_id, rowid FROM tracks WHERE album_id IN (%s) ORDER BY tracknumber" %\
+						   ",".join("?" * len(chunk)), chunk)
+			for album_id, track_id in result:
+				tracks.setdefault(album_id, []).append(track_id)
+		return tracks
+
 	"""
 		Get track filepath for track id
 		arg: int
@@ -527,6 +614,17 @@ class Database:
 			tracks += row
 		return tracks
 
+	"""
+		Get all tracks rowid, modification time and size by filepath
+		ret: {string: (int, int, int)}
+	"""
+	def get_tracks_mtime(self):
+		tracks = {}
+		result = self._sql.execute("SELECT filepath, rowid, mtime, size FROM tracks")
+		for row in result:
+			tracks[row[0]] = row[1:]
+		return tracks
+
 	"""
 		Get track name for track id
 		arg: int
@@ -554,37 +652,173 @@ class Database:
 			return 0
 			
 	"""
-		Search for albums looking like str
+		Search for albums, albums of artists and tracks looking like str
+		Albums are returned first, each album only once
+		Best full text matches come first in albums and in tracks
 		arg: string
-		return: [(int, int)]
-	"""
-	def search_albums(self, string):
-		albums = []
-		result = self._sql.execute("SELECT rowid, artist_id FROM albums where name like ? LIMIT 100", ('%'+string+'%',))
+		return: [(bool, int, string, string, int)] as (is_track, object id, name, artist name, album id)
+	"""
+	def search(self, string):
+		items = []
+		match = self._get_match(string)
+		if match:
+			# bm25 rank of best matches, lower is better
+			# An album matching by its name and its artist keeps its best rank
+			result = self._sql.execute('''WITH album_hits AS (SELECT rowid, rank FROM albums_fts WHERE albums_fts MATCH :match ORDER BY rank LIMIT 100),
+						      artist_hits AS (SELECT rowid, rank FROM artists_fts WHERE artists_fts MATCH :match ORDER BY rank LIMIT 100),
+						      track_hits AS (SELECT rowid, rank FROM tracks_fts WHERE tracks_fts MATCH :match ORDER BY rank LIMIT 100)
+						      SELECT 0, albums.rowid, albums.name, artists.name, albums.rowid,
+						      MIN(COALESCE(album_hits.rank, artist_hits.rank), COALESCE(artist_hits.rank, album_hits.rank))
+						      FROM albums JOIN artists ON artists.rowid=albums.artist_id
+						      LEFT JOIN album_hits ON album_hits.rowid=albums.rowid
+						      LEFT JOIN artist_hits ON artist_hits.rowid=albums.artist_id
+						      WHERE album_hits.rowid IS NOT NULL OR artist_hits.rowid IS NOT NULL
+						      UNION ALL
+						      SELECT 1, tracks.rowid, tracks.name, artists.name, albums.rowid, track_hits.rank
+						      FROM track_hits JOIN tracks ON tracks.rowid=track_hits.rowid
+						      JOIN albums ON albums.rowid=tracks.album_id
+						      JOIN artists ON artists.rowid=albums.artist_id
+						      ORDER BY 1, 6, 4 COLLATE NOCASE, 3 COLLATE NOCASE''',
+						   { "match": match })
+		else:
+			result = self._sql.execute('''SELECT 0, albums.rowid, albums.name, artists.name, albums.rowid
+						      FROM albums, artists
+						      WHERE artists.rowid=albums.artist_id AND (albums.name LIKE :like OR artists.name LIKE :like)
+						      UNION ALL
+						      SELECT 1, tracks.rowid, tracks.name, artists.name, albums.rowid
+						      FROM tracks, albums, artists
+						      WHERE albums.rowid=tracks.album_id AND artists.rowid=albums.artist_id
+						      AND tracks.rowid IN (SELECT rowid FROM tracks WHERE name LIKE :like LIMIT 100)
+						      ORDER BY 1, 4 COLLATE NOCASE, 3 COLLATE NOCASE''',
+						   { "like": '%'+string+'%' })
 		for row in result:
-			albums += (row,)
-		return albums
+			items.append((row[0] == 1,) + row[1:5])
+		return items
+
+#######################
+# PRIVATE             #
+#######################
 
 	"""
-		Search for artists looking like str
+		Get a full text query matching every word of string as a prefix
 		arg: string
-		return: [int]
+		ret: string or None if full text search is not available
+	"""
+	def _get_match(self, string):
+		if not self._fts:
+			return None
+		words = []
+		for word in string.split():
+			words.append('"%s"*' % word.replace('"', '""'))
+		if words:
+			return " ".join(words)
+		else:
+			return None
+
 	"""
-	def search_artists(self, string):
-		artists = []
-		result = self._sql.execute("SELECT rowid FROM artists where name like ? LIMIT 100", ('%'+string+'%',))
+		Setup connection from settings:
+			- db-wal: WAL journal, readers do not block scanner writes
+			- db-cache-size: page cache size in KiB
+			- db-mmap-size: memory mapped I/O size in MiB
+	"""
+	def _set_pragmas(self):
+		settings = Gio.Settings.new('org.gnome.Lollypop')
+		if settings.get_boolean('db-wal'):
+			self._sql.execute("PRAGMA journal_mode=WAL")
+			# Safe with WAL, only last transactions may be lost on power failure
+			self._sql.execute("PRAGMA synchronous=NORMAL")
+		else:
+			self._sql.execute("PRAGMA journal_mode=DELETE")
+		self._sql.execute("PRAGMA cache_size=-%d" % settings.get_int('db-cache-size'))
+		self._sql.execute("PRAGMA mmap_size=%d" % (settings.get_int('db-mmap-size') * 1024 * 1024))
+
+	"""
+		Upgrade db schema to current version
+		Schema version is stored in PRAGMA user_version,
+		each upgrade runs once and bumps it
+	"""
+	def _upgrade(self):
+		upgrades = [ self._upgrade_tables,
+			     self._upgrade_indexes,
+			     self._upgrade_search ]
+		version = self._sql.execute("PRAGMA user_version").fetchone()[0]
+		for upgrade in upgrades[version:]:
+			upgrade()
+			version += 1
+			self._sql.execute("PRAGMA user_version=%d" % version)
+			self._sql.commit()
+
+	"""
+		Version 1: create tables, upgrade tables from unversioned dbs
+	"""
+	def _upgrade_tables(self):
+		if "albums" not in self._get_tables():
+			self._sql.execute(self.create_albums)
+			self._sql.execute(self.create_artists)
+			self._sql.execute(self.create_genres)
+			self._sql.execute(self.create_tracks)
+			return
+
+		# Add year to albums table, tracks reference albums so drop them too
+		if "year" not in self._get_columns("albums"):
+			self._sql.execute("DROP TABLE albums")
+			self._sql.execute("DROP TABLE tracks")
+			self._sql.execute(self.create_albums)
+			self._sql.execute(self.create_tracks)
+		# Add mtime and size to tracks table
+		if "mtime" not in self._get_columns("tracks"):
+			self._sql.execute("ALTER TABLE tracks ADD COLUMN mtime INT NOT NULL DEFAULT 0")
+			self._sql.execute("ALTER TABLE tracks ADD COLUMN size INT NOT NULL DEFAULT 0")
+
+	"""
+		Version 2: create indexes used by lookups
+	"""
+	def _upgrade_indexes(self):
+		for index in self.create_indexes:
+			self._sql.execute(index)
+
+	"""
+		Version 3: full text search tables for albums, artists and tracks
+		Tables are kept in sync with triggers, skipped if sqlite lacks FTS5
+	"""
+	def _upgrade_search(self):
+		for table in [ "albums", "artists", "tracks" ]:
+			try:
+				self._sql.execute(self.create_fts % (table, table))
+			except sqlite3.OperationalError as e:
+				print("Database::_upgrade_search(): %s" % e)
+				return
+			self._sql.execute('''CREATE TRIGGER %s_fts_insert AFTER INSERT ON %s BEGIN
+						INSERT INTO %s_fts(rowid, name) VALUES (new.rowid, new.name);
+					     END''' % (table, table, table))
+			self._sql.execute('''CREATE TRIGGER %s_fts_delete AFTER DELETE ON %s BEGIN
+						INSERT INTO %s_fts(%s_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+					     END''' % (table, table, table, table))
+			self._sql.execute('''CREATE TRIGGER %s_fts_update AFTER UPDATE OF name ON %s BEGIN
+						INSERT INTO %s_fts(%s_fts, rowid, name) VALUES ('delete', old.rowid, old.name);
+						INSERT INTO %s_fts(rowid, name) VALUES (new.rowid, new.name);
+					     END''' % (table, table, table, table, table))
+			self._sql.execute("INSERT INTO %s_fts(%s_fts) VALUES ('rebuild')" % (table, table))
+
+	"""
+		Get tables names
+		ret: [string]
+	"""
+	def _get_tables(self):
+		tables = []
+		result = self._sql.execute("SELECT name FROM sqlite_master WHERE type='table'")
 		for row in result:
-			artists += row
-		return artists
+			tables += row
+		return tables
 
 	"""
-		Search for tracks looking like str
+		Get columns names for table
 		arg: string
-		return: [int, string]
+		ret: [string]
 	"""
-	def search_tracks(self, string):
-		tracks = []
-		result = self._sql.execute("SELECT rowid, name FROM tracks where name like ? LIMIT 100", ('%'+string+'%',))
+	def _get_columns(self, table):
+		columns = []
+		result = self._sql.execute("PRAGMA table_info(%s)" % table)
 		for row in result:
-			tracks += (row,)
-		return tracks
+			columns.append(row[1])
+		return columns
@@ -15,7 +15,11 @@
 
 from gi.repository import Gtk, Gdk, GLib, Gio, GObject, Gst, GstAudio
 from lollypop.database import Database
+from lollypop.playqueue import PlayQueue
+from lollypop.sampler import WeightedSampler
 import random
+import json
+import os
 
 class PlaybackStatus:
     PLAYING = 0
@@ -25,6 +29,9 @@ class PlaybackStatus:
 class Player(GObject.GObject):
 	
 	EPSILON = 0.001
+	STATE_PATH = "%s/player.json" % Database.LOCAL_PATH
+	# Seconds to wait for more changes before writing state
+	_STATE_DELAY = 2
 	
 	__gsignals__ = {
         'current-changed': (GObject.SIGNAL_RUN_FIRST, None, (int,)),
@@ -43,14 +50,42 @@ class Player(GObject.GObject):
 		self._current_track_album_id = -1
 		self._current_track_id = -1
 		self._albums = []
-		self._progress_callback = None
-		self._timeout = None
+		# Position in albums and tracks ids by album id, for current albums
+		self._albums_pos = {}
+		self._albums_tracks = {}
+		# [callback, resolution, last position] by listener id
+		self._position_listeners = {}
+		self._position_listener_id = 0
+		# Periodic clock id or timeout driving listeners, bumped generation stops old ones
+		self._position_clock_id = None
+		self._position_timeout = None
+		self._position_generation = 0
 		self._shuffle = False
 		self._shuffle_tracks_history = []
-		self._shuffle_albums_history = []
+		self._shuffle_tracks_played = set()
+		# Random (track_id, album_id) order for current albums, next candidate position
+		self._shuffle_order = None
+		self._shuffle_pos = 0
+		# Party mode albums, their unplayed tracks and popularity by sampler index
+		self._party_sampler = None
+		self._party_albums = []
+		self._party_index = {}
+		self._party_tracks = []
+		self._party_popularity = []
+		# (track_id, album_id) drawn for next party track
+		self._party_next = None
 		self._party = False
 		self._party_ids = []
-		self._playlist = []
+		self._playlist = PlayQueue()
+		for signal in ["track-inserted", "track-removed", "track-moved"]:
+			self._playlist.connect(signal, self._on_playlist_changed)
+		self._state_timeout = None
+		# Position to seek to once restored track is paused
+		self._restore_position = None
+		# (track_id, uri) next() will play, track queued in playbin for gapless playback
+		self._next = None
+		self._queued_track_id = None
+		self._gapless = Gio.Settings.new('org.gnome.Lollypop').get_boolean('gapless')
 
 		self._db = db
 		self._player = Gst.ElementFactory.make('playbin', 'player')
@@ -62,6 +97,11 @@ class Player(GObject.GObject):
 		#self._bus.connect('message::state-changed', self._on_bus_state_changed)
 		#self.bus.connect('message::error', self._onBusError)
 		self._bus.connect('message::eos', self._on_bus_eos)
+		self._bus.connect('message::async-done', self._on_bus_async_done)
+		self._bus.connect('message::new-clock', self._on_bus_new_clock)
+		if self._gapless:
+			self._player.connect('about-to-finish', self._on_about_to_finish)
+			self._bus.connect('message::stream-start', self._on_bus_stream_start)
 		
 	"""
 		Return True if player is playing
@@ -110,8 +150,7 @@ class Player(GObject.GObject):
 	"""
 	def play(self):
 		self._player.set_state(Gst.State.PLAYING)
-		if not self._timeout:
-			self._timeout = GLib.timeout_add(1000, self._update_position)
+		self._update_position_clock()
 		self.emit("playback-status-changed")
 
 	"""
@@ -120,18 +159,17 @@ class Player(GObject.GObject):
 	def pause(self):
 		self._player.set_state(Gst.State.PAUSED)
 		self.emit("playback-status-changed")
-		if self._timeout:
-			GLib.source_remove(self._timeout)
-			self._timeout = None
+		self._save_state_delayed()
+		self._stop_position_clock()
 
 	"""
 		Change player state to STOPPED
 	"""
 	def stop(self):
 		self._player.set_state(Gst.State.NULL)
-		if self._timeout:
-			GLib.source_remove(self._timeout)
-			self._timeout = None
+		self._queued_track_id = None
+		self._restore_position = None
+		self._stop_position_clock()
 
 	"""
 		Set PLAYING if PAUSED
@@ -154,25 +192,21 @@ class Player(GObject.GObject):
 			try:
 				track_id = self._shuffle_tracks_history[-2]
 				# We remove to last items because playing will readd track_id to list
-				self._shuffle_tracks_history.pop()
-				self._shuffle_tracks_history.pop()
+				self._shuffle_tracks_played.discard(self._shuffle_tracks_history.pop())
+				self._shuffle_tracks_played.discard(self._shuffle_tracks_history.pop())
 			except Exception as e:
 				print(e)
 				track_id = None
 		elif self._current_track_number != -1:
-			tracks = self._db.get_tracks_ids_by_album_id(self._current_track_album_id)
 			if self._current_track_number <=0 : #Prev album
-				pos = self._albums.index(self._current_track_album_id)
-				if pos - 1 < 0: #we are on last album, go to first
-					pos = len(self._albums) - 1
-				else:
-					pos -= 1
-				self._current_track_album_id = self._albums[pos]
-				tracks = self._db.get_track_ids_by_album_id(self._current_track_album_id)
-				self._current_track_number = len(tracks) - 1
-				track_id = self._db.get_tracks_ids_by_album_id(self._albums[pos])[self._current_track_number]
+				(album_id, tracks) = self._get_sibling_tracks(self._current_track_album_id, -1)
+				if tracks:
+					self._current_track_album_id = album_id
+					self._current_track_number = len(tracks) - 1
 			else:
+				tracks = self._get_album_tracks(self._current_track_album_id)
 				self._current_track_number -= 1
+			if tracks:
 				track_id = tracks[self._current_track_number]
 	
 		if track_id:			
@@ -180,31 +214,10 @@ class Player(GObject.GObject):
 	
 	"""
 		Play next track
-		If shuffle or party => get a random file not already played
-		Else => get next track in currents albums
 	"""
 	def next(self):
-		# Look first at user playlist
-		if len(self._playlist) > 0:
-			self.load(self._playlist.pop(0))
-		# Get a random album/track
-		elif self._shuffle or self._party:
-			self._shuffle_next()
-		elif self._current_track_number != -1:
-			track_id = None
-			tracks = self._db.get_tracks_ids_by_album_id(self._current_track_album_id)
-			if self._current_track_number + 1 >= len(tracks): #next album
-				pos = self._albums.index(self._current_track_album_id)
-				if pos +1 >= len(self._albums): #we are on last album, go to first
-					pos = 0
-				else:
-					pos += 1
-				self._current_track_album_id = self._albums[pos]
-				self._current_track_number = 0
-				track_id = self._db.get_tracks_ids_by_album_id(self._albums[pos])[0]
-			else:
-				self._current_track_number += 1
-				track_id = tracks[self._current_track_number]	
+		track_id = self._go_next()
+		if track_id is not None:
 			self.load(track_id)
 
 	"""
@@ -228,13 +241,15 @@ class Player(GObject.GObject):
 			self._rgvolume.props.album_mode = 0
 		else:
 			self._rgvolume.props.album_mode = 1
-		self._shuffle_tracks_history = []
+		self._clear_shuffle()
 		self._shuffle = shuffle
 		if not shuffle and self._current_track_id != -1:
 			album_id = self._db.get_album_id_by_track_id(self._current_track_id)
 			artist_id = self._db.get_artist_id_by_album_id(album_id)
 			genre_id = self._db.get_genre_id_by_album_id(album_id)
 			self.set_albums(artist_id, genre_id, self._current_track_id)
+		else:
+			self._prepare_next()
 
 	"""
 		Set party mode on
@@ -246,21 +261,88 @@ class Player(GObject.GObject):
 		else:
 			self._rgvolume.props.album_mode = 1
 		self._party = party
-		self._shuffle_tracks_history = []
+		self._clear_shuffle()
 		if party:
 			if len(self._party_ids) > 0:
-				self._albums = self._db.get_party_albums_ids(self._party_ids)
+				self._set_albums(self._db.get_party_albums_ids(self._party_ids))
 			else:
-				self._albums = self._db.get_all_albums_ids()
-			track_id = self._get_random()
-			self.load(track_id)
-			self._current_track_album_id = self._db.get_album_id_by_track_id(track_id)
+				self._set_albums(self._db.get_all_albums_ids())
+			track_id = self._shuffle_next()
+			if track_id is not None:
+				self.load(track_id)
 		else:
 			album_id = self._db.get_album_id_by_track_id(self._current_track_id)
 			artist_id = self._db.get_artist_id_by_album_id(album_id)
 			genre_id = self._db.get_genre_id_by_album_id(album_id)
 			self.set_albums(artist_id, genre_id, self._current_track_id)
 
+	"""
+		Make album more popular
+		Party mode draws its tracks more often from now
+		arg: int
+	"""
+	def set_more_popular(self, album_id):
+		self._db.set_more_popular(album_id)
+		index = self._party_index.get(album_id)
+		if self._party_sampler is not None and index is not None:
+			self._party_popularity[index] += 1
+			self._set_party_weight(index)
+
+	"""
+		Write player state now, so it can be restored at next startup
+	"""
+	def save_state(self):
+		if self._state_timeout:
+			GLib.source_remove(self._state_timeout)
+		self._write_state()
+
+	"""
+		Restore player state saved by a previous run
+		Current track is loaded paused at its saved position
+		Do nothing if state is missing or its track changed on disk
+	"""
+	def restore_state(self):
+		try:
+			with open(self.STATE_PATH, "r") as f:
+				state = json.load(f)
+			track_id = state["track_id"]
+			if self._db.get_track_filepath(track_id) != state["filepath"]:
+				return
+			# Albums may have been emptied or removed since state was saved
+			self._albums_tracks = self._db.get_tracks_ids_by_albums_ids(state["albums"])
+			self._albums = [album_id for album_id in state["albums"] if album_id in self._albums_tracks]
+			self._albums_pos = {}
+			for pos, album_id in enumerate(self._albums):
+				self._albums_pos.setdefault(album_id, pos)
+			self._shuffle_order = None
+			self._party_sampler = None
+			self._current_track_album_id = state["album_id"]
+			tracks = self._get_album_tracks(self._current_track_album_id)
+			if track_id in tracks:
+				self._current_track_number = tracks.index(track_id)
+			else:
+				self._current_track_number = -1
+			# Restore modes without set_shuffle()/set_party(), they clear history
+			self._shuffle = state["shuffle"]
+			self._party = state["party"]
+			if self._shuffle or self._party:
+				self._rgvolume.props.album_mode = 0
+			else:
+				self._rgvolume.props.album_mode = 1
+			# Current track is added back to history by _load_track()
+			self._shuffle_tracks_history = state["history"]
+			if self._shuffle_tracks_history[-1:] == [track_id]:
+				self._shuffle_tracks_history.pop()
+			self._shuffle_tracks_played = set(self._shuffle_tracks_history)
+			self._playlist.set_tracks(state["playlist"])
+			self._restore_position = state["position"]
+		except Exception as e:
+			print("Player::restore_state(): %s" % e)
+			return
+		self._load_track(track_id)
+		self._player.set_state(Gst.State.PAUSED)
+		self.emit("playback-status-changed")
+
 	"""
 		Set party ids to ids
 		Party ids are genres_id (and specials ids) used to populate party mode
@@ -280,40 +362,71 @@ class Player(GObject.GObject):
 	def is_party(self):
 		return self._party
 
+	"""
+		Return True if shuffle mode on
+	"""
+	def is_shuffle(self):
+		return self._shuffle
+
 	"""
 		Set album list (for next/prev)
 		If artist_id and genre_id => Albums for artist_id and genre_id
 		Elif genre_id => Albums for genre_id
 		Else => Albums populars
+		Tracks of albums are loaded now, next/prev do not query database
 	"""
 	def set_albums(self, artist_id, genre_id, track_id):
-		self._albums = []
 		# We are in artist view, add all albums from artist for genre
 		if artist_id:
-			self._albums = self._db.get_albums_by_artist_and_genre_ids(artist_id, genre_id)
+			self._set_albums(self._db.get_albums_by_artist_and_genre_ids(artist_id, genre_id))
 		# We are in album view, add all albums from genre
 		elif genre_id:
-			self._albums = self._db.get_albums_by_genre_id(genre_id)
+			self._set_albums(self._db.get_albums_by_genre_id(genre_id))
 		# We are in popular view, add populars albums
 		else:
-			self._albums = self._db.get_albums_popular()
+			self._set_albums(self._db.get_albums_popular())
 		album_id = self._db.get_album_id_by_track_id(track_id)
-		tracks = self._db.get_tracks_ids_by_album_id(album_id)
+		tracks = self._get_album_tracks(album_id)
 		self._current_track_number = tracks.index(track_id) 
 		self._current_track_album_id = album_id
+		self._prepare_next()
 
 	"""
 		Empty albums
 	"""
 	def clear_albums(self):
-		self._albums = []
+		self._set_albums([])
+		self._prepare_next()
 
 	"""
-		Set progress callback, will be called every seconds
-		Callback is a function with one float arg position
+		Call callback(position) with position in seconds
+		about every resolution seconds while playing
+		Position is not followed while there is no listener
+		arg: function, float
+		ret: int, listener id
 	"""
-	def set_progress_callback(self, callback):
-		self._progress_callback = callback
+	def add_position_listener(self, callback, resolution=1):
+		self._position_listener_id += 1
+		self._position_listeners[self._position_listener_id] = [callback, resolution, None]
+		self._update_position_clock()
+		return self._position_listener_id
+
+	"""
+		Stop calling listener
+		arg: int, listener id
+	"""
+	def remove_position_listener(self, listener_id):
+		self._position_listeners.pop(listener_id, None)
+		self._update_position_clock()
+
+	"""
+		Return current track position in seconds
+	"""
+	def get_position(self):
+		ok, position = self._player.query_position(Gst.Format.TIME)
+		if ok:
+			return position / Gst.SECOND
+		return 0
 
 	"""
 		Convert seconds to a pretty string
@@ -330,6 +443,7 @@ class Player(GObject.GObject):
 	"""
 	def add_to_playlist(self, track_id):
 		self._playlist.append(track_id)
+		self._prepare_next()
 
 	"""
 		Remove track from playlist
@@ -337,30 +451,39 @@ class Player(GObject.GObject):
 
 	def del_from_playlist(self, track_id):
 		self._playlist.remove(track_id)
+		self._prepare_next()
 
 	"""
 		Set playlist to new_playlist
 	"""
 	def set_playlist(self, new_playlist):
-		self._playlist = new_playlist
+		self._playlist.set_tracks(new_playlist)
+		self._prepare_next()
 		self.emit("playlist-changed")
 	"""
 		Return playlist
 	"""
 	def get_playlist(self):
+		return self._playlist.get_tracks()
+
+	"""
+		Return playlist queue, connect to its signals to follow changes
+		ret: PlayQueue
+	"""
+	def get_playqueue(self):
 		return self._playlist
 
 	"""
 		ReturnTrue if track_id exist in playlist
 	"""
 	def is_in_playlist(self, track_id):
-		return track_id in self._playlist
+		return self._playlist.contains(track_id)
 
 	"""
 		Return track position in playlist
 	"""
 	def get_track_position(self, track_id):
-		return self._playlist.index(track_id)
+		return self._playlist.get_position(track_id)
 
 #######################
 # PRIVATE             #
@@ -397,33 +520,235 @@ class Player(GObject.GObject):
 		self._player.set_property("audio-sink", self._rgfilter)
 
 	"""
-		Next track in shuffle mode
+		Set current albums, load their tracks and index their position
+	"""
+	def _set_albums(self, albums):
+		self._albums = albums
+		self._albums_pos = {}
+		for pos, album_id in enumerate(albums):
+			self._albums_pos.setdefault(album_id, pos)
+		self._albums_tracks = self._db.get_tracks_ids_by_albums_ids(albums)
+		self._shuffle_order = None
+		self._party_sampler = None
+		self._save_state_delayed()
+
+	"""
+		Return tracks ids for album_id, from current albums if possible
+	"""
+	def _get_album_tracks(self, album_id):
+		tracks = self._albums_tracks.get(album_id)
+		if tracks is None:
+			tracks = self._db.get_tracks_ids_by_album_id(album_id)
+			self._albums_tracks[album_id] = tracks
+		return tracks
+
+	"""
+		Return album at offset from album_id in current albums, wrap around
+		Albums not in current albums are before first one
+		Return album_id if there is no current albums
+	"""
+	def _get_sibling_album(self, album_id, offset):
+		if not self._albums:
+			return album_id
+		pos = self._albums_pos.get(album_id, -1 if offset > 0 else 0)
+		return self._albums[(pos + offset) % len(self._albums)]
+
+	"""
+		Return first album with tracks at offset, 2 * offset, ... from album_id
+		in current albums, and its tracks
+		Return (album_id, []) if no album has tracks
+	"""
+	def _get_sibling_tracks(self, album_id, offset):
+		for i in range(max(len(self._albums), 1)):
+			album_id = self._get_sibling_album(album_id, offset)
+			tracks = self._get_album_tracks(album_id)
+			if tracks:
+				return (album_id, tracks)
+		return (album_id, [])
+
+	"""
+		Move to next track and return its id, None if there is no next track
+		Look first at user playlist
+		If shuffle or party => get a random file not already played
+		Else => get next track in currents albums
+	"""
+	def _go_next(self):
+		if len(self._playlist) > 0:
+			return self._playlist.pop_first()
+		elif self._shuffle or self._party:
+			return self._shuffle_next()
+		elif self._current_track_number != -1:
+			tracks = self._get_album_tracks(self._current_track_album_id)
+			if self._current_track_number + 1 >= len(tracks): #next album
+				(album_id, tracks) = self._get_sibling_tracks(self._current_track_album_id, 1)
+				if not tracks:
+					return None
+				self._current_track_album_id = album_id
+				self._current_track_number = 0
+			else:
+				self._current_track_number += 1
+			return tracks[self._current_track_number]
+		return None
+
+	"""
+		Return track id _go_next() will return without changing state,
+		None if unknown
+	"""
+	def _peek_next(self):
+		if len(self._playlist) > 0:
+			return self._playlist.get_first()
+		elif self._shuffle or self._party:
+			return self._peek_random()[0]
+		elif self._current_track_number != -1:
+			tracks = self._get_album_tracks(self._current_track_album_id)
+			if self._current_track_number + 1 >= len(tracks): #next album
+				(album_id, tracks) = self._get_sibling_tracks(self._current_track_album_id, 1)
+				if tracks:
+					return tracks[0]
+			else:
+				return tracks[self._current_track_number + 1]
+		return None
+
+	"""
+		Remember track next() will play and its uri, used for gapless playback
+		Call it each time next track may change
+	"""
+	def _prepare_next(self):
+		if not self._gapless:
+			return
+		track_id = self._peek_next()
+		if track_id is None:
+			self._next = None
+		else:
+			self._next = (track_id, "file://"+self._db.get_track_filepath(track_id))
+
+	"""
+		Move to next track in shuffle mode and return its id
+		Start a new shuffle when all tracks have been played
 	"""
 	def _shuffle_next(self):
-		track_id = self._get_random()
+		(track_id, album_id) = self._get_random()
 		# Need to clear history
-		if not track_id:
-			self._albums = self._shuffle_albums_history
-			self._shuffle_tracks_history = []
-			self._shuffle_albums_history = []
-			self._shuffle_next()
-			return
-		self.load(track_id)
-		self._current_track_album_id = self._db.get_album_id_by_track_id(track_id)
+		if track_id is None and self._shuffle_tracks_history:
+			self._clear_shuffle()
+			(track_id, album_id) = self._get_random()
+		if track_id is not None:
+			self._current_track_album_id = album_id
+		return track_id
 
 	"""
-		Return a random track and make sure it has never been played
+		Return a random (track_id, album_id) never played,
+		(None, None) if all tracks have been played
 	"""
 	def _get_random(self):
-		for album in sorted(self._albums, key=lambda *args: random.random()):
-			tracks = self._db.get_tracks_ids_by_album_id(album)
-			for track in sorted(tracks, key=lambda *args: random.random()):
-				if not track in self._shuffle_tracks_history:
-					return track
-			# No new tracks for this album, remove it
-			self._albums.remove(album)
-			self._shuffle_albums_history.append(album)
-		return None
+		if self._party:
+			return self._get_party_random()
+		track = self._peek_random()
+		if track[0] is not None:
+			self._shuffle_pos += 1
+		return track
+
+	"""
+		Return random (track_id, album_id) _get_random() will return
+		Shuffle order is computed once for current albums
+	"""
+	def _peek_random(self):
+		if self._party:
+			return self._peek_party_random()
+		if self._shuffle_order is None:
+			self._shuffle_order = []
+			for album_id in self._albums_pos:
+				for track_id in self._get_album_tracks(album_id):
+					self._shuffle_order.append((track_id, album_id))
+			random.shuffle(self._shuffle_order)
+			self._shuffle_pos = 0
+		# Skip tracks played since shuffle
+		while self._shuffle_pos < len(self._shuffle_order):
+			track = self._shuffle_order[self._shuffle_pos]
+			if not track[0] in self._shuffle_tracks_played:
+				return track
+			self._shuffle_pos += 1
+		return (None, None)
+
+	"""
+		Return a (track_id, album_id) never played, (None, None) if all tracks have been played
+		Remove it from tracks to draw
+	"""
+	def _get_party_random(self):
+		track = self._peek_party_random()
+		if track[0] is not None:
+			self._remove_party_track(self._party_index[track[1]], track[0])
+			self._party_next = None
+		return track
+
+	"""
+		Return (track_id, album_id) _get_party_random() will return
+		Albums are drawn in proportion to their popularity + 1
+		times their number of unplayed tracks, then an unplayed track is drawn
+	"""
+	def _peek_party_random(self):
+		if self._party_sampler is None:
+			self._build_party_sampler()
+		if self._party_next is not None and\
+		   not self._party_next[0] in self._shuffle_tracks_played:
+			return self._party_next
+		self._party_next = None
+		while True:
+			index = self._party_sampler.sample()
+			if index is None:
+				return (None, None)
+			track_id = random.choice(self._party_tracks[index])
+			# Played since sampler was built
+			if track_id in self._shuffle_tracks_played:
+				self._remove_party_track(index, track_id)
+			else:
+				self._party_next = (track_id, self._party_albums[index])
+				return self._party_next
+
+	"""
+		Build party sampler from current albums, played tracks are left out
+	"""
+	def _build_party_sampler(self):
+		popularity = self._db.get_albums_popularity()
+		self._party_albums = list(self._albums_pos.keys())
+		self._party_index = {}
+		self._party_tracks = []
+		self._party_popularity = []
+		weights = []
+		for index, album_id in enumerate(self._party_albums):
+			tracks = []
+			for track_id in self._get_album_tracks(album_id):
+				if not track_id in self._shuffle_tracks_played:
+					tracks.append(track_id)
+			self._party_index[album_id] = index
+			self._party_tracks.append(tracks)
+			self._party_popularity.append(popularity.get(album_id, 0))
+			weights.append((self._party_popularity[index] + 1) * len(tracks))
+		self._party_sampler = WeightedSampler(weights)
+		self._party_next = None
+
+	"""
+		Remove track_id from tracks to draw for album at index
+	"""
+	def _remove_party_track(self, index, track_id):
+		self._party_tracks[index].remove(track_id)
+		self._set_party_weight(index)
+
+	"""
+		Update sampler weight for album at index
+	"""
+	def _set_party_weight(self, index):
+		self._party_sampler.set_weight(index, (self._party_popularity[index] + 1) *\
+						      len(self._party_tracks[index]))
+
+	"""
+		Clear shuffle history, next random track will come from a new shuffle
+	"""
+	def _clear_shuffle(self):
+		self._shuffle_tracks_history = []
+		self._shuffle_tracks_played = set()
+		self._shuffle_order = None
+		self._party_sampler = None
 
 	"""
 		On End Of Stream => next()
@@ -432,24 +757,168 @@ class Player(GObject.GObject):
 		self.next()
 
 	"""
-		Call progress callback with new position
+		Seek restored track to its saved position once paused
+	"""
+	def _on_bus_async_done(self, bus, message):
+		if self._restore_position:
+			position = self._restore_position
+			self._restore_position = None
+			self.seek(position)
+
+	"""
+		Save state on user playlist changes
+	"""
+	def _on_playlist_changed(self, playlist, track_id, pos):
+		self._save_state_delayed()
+
+	"""
+		Write player state in a few seconds, changes meanwhile are written at once
+	"""
+	def _save_state_delayed(self):
+		if not self._state_timeout:
+			self._state_timeout = GLib.timeout_add_seconds(self._STATE_DELAY, self._write_state)
+
+	"""
+		Write player state to a temporary file and rename it over state file
+		Nothing is written without a current track
+	"""
+	def _write_state(self):
+		self._state_timeout = None
+		if self._current_track_id == -1:
+			return False
+		ok, position = self._player.query_position(Gst.Format.TIME)
+		state = { "track_id": self._current_track_id,
+			  "filepath": self._db.get_track_filepath(self._current_track_id),
+			  "album_id": self._current_track_album_id,
+			  "track_number": self._current_track_number,
+			  "albums": self._albums,
+			  "shuffle": self._shuffle,
+			  "party": self._party,
+			  "history": self._shuffle_tracks_history,
+			  "playlist": self._playlist.get_tracks(),
+			  "position": position // Gst.SECOND if ok else 0 }
+		try:
+			with open(self.STATE_PATH + ".tmp", "w") as f:
+				json.dump(state, f)
+			os.replace(self.STATE_PATH + ".tmp", self.STATE_PATH)
+		except Exception as e:
+			print("Player::_write_state(): %s" % e)
+		return False
+
+	"""
+		On about to finish, queue next track in playbin, pipeline stays up
+		Run in a streaming thread, only use what _prepare_next() computed
+	"""
+	def _on_about_to_finish(self, playbin):
+		next = self._next
+		if next:
+			self._queued_track_id = next[0]
+			playbin.set_property('uri', next[1])
+
+	"""
+		On stream start of a queued track, move to it
+		If next track changed meanwhile, load it
+	"""
+	def _on_bus_stream_start(self, bus, message):
+		track_id = self._queued_track_id
+		if track_id is None:
+			return
+		self._queued_track_id = None
+		next_id = self._go_next()
+		if next_id is None or next_id == track_id:
+			self._load_track(track_id, False)
+		else:
+			self.load(next_id)
+
+	"""
+		On new pipeline clock, follow position with it
+	"""
+	def _on_bus_new_clock(self, bus, message):
+		self._update_position_clock()
+
+	"""
+		Follow position at smallest listener resolution while playing
+		Pipeline clock wakes us up, there is no wakeup without listener or while paused
+		Fall back to a timeout if clock can't be used
 	"""
-	def _update_position(self):
-		if self._progress_callback:
-			position = self._player.query_position(Gst.Format.TIME)[1] / 1000000000
-			if position > 0:
-				self._progress_callback(position * 60)
+	def _update_position_clock(self):
+		self._stop_position_clock()
+		if not self._position_listeners or not self.is_playing():
+			return
+		resolution = min(listener[1] for listener in self._position_listeners.values())
+		# Clock is set on PLAYING, we will be called again on new-clock message
+		clock = self._player.get_clock()
+		if clock is None:
+			return
+		try:
+			self._position_clock_id = clock.new_periodic_id(clock.get_time(),
+									int(resolution * Gst.SECOND))
+			Gst.Clock.id_wait_async(self._position_clock_id, self._on_position_clock,
+						self._position_generation)
+		except Exception as e:
+			print("Player::_update_position_clock(): %s" % e)
+			self._position_clock_id = None
+			self._position_timeout = GLib.timeout_add(int(resolution * 1000),
+								  self._notify_position,
+								  self._position_generation)
+
+	"""
+		Stop following position
+	"""
+	def _stop_position_clock(self):
+		self._position_generation += 1
+		if self._position_clock_id is not None:
+			Gst.Clock.id_unschedule(self._position_clock_id)
+			self._position_clock_id = None
+		if self._position_timeout:
+			GLib.source_remove(self._position_timeout)
+			self._position_timeout = None
+
+	"""
+		On clock tick, notify listeners in main loop
+		Run in clock thread
+	"""
+	def _on_position_clock(self, clock, time, clock_id, generation):
+		GLib.idle_add(self._on_position_tick, generation)
+		return True
+
+	"""
+		Notify listeners once
+	"""
+	def _on_position_tick(self, generation):
+		self._notify_position(generation)
+		return False
+
+	"""
+		Call listeners whose resolution elapsed with new position
+		Return False if position is not followed anymore for generation
+	"""
+	def _notify_position(self, generation):
+		if generation != self._position_generation:
+			return False
+		position = self.get_position()
+		resolution = min(listener[1] for listener in self._position_listeners.values())
+		for listener in list(self._position_listeners.values()):
+			last = listener[2]
+			# Allow half a tick of clock jitter
+			if last is None or abs(position - last) >= listener[1] - resolution / 2:
+				listener[2] = position
+				listener[0](position)
 		return True
 
 	"""
-		Load track_id
+		Load track_id, set playbin uri if set_uri
 		Emit "current-changed" to notify others components
 		Add track to shuffle history if needed
 	"""
-	def _load_track(self, track_id):
+	def _load_track(self, track_id, set_uri=True):
 		self._current_track_id = track_id
 		self.emit("current-changed", track_id)
-		self._player.set_property('uri', "file://"+self._db.get_track_filepath(track_id))
+		if set_uri:
+			self._player.set_property('uri', "file://"+self._db.get_track_filepath(track_id))
 		self._duration = self._db.get_track_length(track_id)
 		if self._shuffle or self._party:
 			self._shuffle_tracks_history.append(track_id)
+			self._shuffle_tracks_played.add(track_id)
+		self._prepare_next()
+		self._save_state_delayed()
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# Copyright (c) 2014 Cedric Bellegarde <gnumdk@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from gi.repository import GObject
+from collections import deque
+
+class PlayQueue(GObject.GObject):
+
+	"""
+		Signals are emitted once queue is updated, with track id and its position:
+			- track-inserted: new position of track
+			- track-removed: old position of track, following tracks moved up by one
+			- track-moved: new position of track
+	"""
+	__gsignals__ = {
+        'track-inserted': (GObject.SIGNAL_RUN_FIRST, None, (int, int)),
+        'track-removed': (GObject.SIGNAL_RUN_FIRST, None, (int, int)),
+        'track-moved': (GObject.SIGNAL_RUN_FIRST, None, (int, int))
+    }
+
+	"""
+		Init an empty queue of unique track ids
+		Each track has a sequence number, its position is sequence number
+		minus sequence number of first track
+	"""
+	def __init__(self):
+		GObject.GObject.__init__(self)
+		self._tracks = deque()
+		self._seqs = {}
+		self._head = 0
+
+	"""
+		Return number of tracks in queue
+	"""
+	def __len__(self):
+		return len(self._tracks)
+
+	"""
+		Return True if track_id is in queue
+		arg: int
+	"""
+	def contains(self, track_id):
+		return track_id in self._seqs
+
+	"""
+		Return position of track_id in queue
+		arg: int
+		ret: int
+	"""
+	def get_position(self, track_id):
+		return self._seqs[track_id] - self._head
+
+	"""
+		Return tracks in queue order
+		ret: [int]
+	"""
+	def get_tracks(self):
+		return list(self._tracks)
+
+	"""
+		Return first track, None if queue is empty
+	"""
+	def get_first(self):
+		if self._tracks:
+			return self._tracks[0]
+		return None
+
+	"""
+		Remove first track and return it, None if queue is empty
+	"""
+	def pop_first(self):
+		if not self._tracks:
+			return None
+		track_id = self._tracks.popleft()
+		del self._seqs[track_id]
+		self._head += 1
+		self.emit("track-removed", track_id, 0)
+		return track_id
+
+	"""
+		Add track_id at end of queue if not already in
+		arg: int
+	"""
+	def append(self, track_id):
+		if track_id in self._seqs:
+			return
+		self._seqs[track_id] = self._head + len(self._tracks)
+		self._tracks.append(track_id)
+		self.emit("track-inserted", track_id, len(self._tracks) - 1)
+
+	"""
+		Remove track_id from queue
+		arg: int
+	"""
+	def remove(self, track_id):
+		pos = self._seqs.pop(track_id) - self._head
+		del self._tracks[pos]
+		for i in range(pos, len(self._tracks)):
+			self._seqs[self._tracks[i]] -= 1
+		self.emit("track-removed", track_id, pos)
+
+	"""
+		Replace queue content with tracks
+		Emit track-removed/track-inserted for tracks leaving/joining queue
+		and track-moved for others tracks at a new position
+		arg: [int]
+	"""
+	def set_tracks(self, tracks):
+		old = {}
+		for track_id, seq in self._seqs.items():
+			old[track_id] = seq - self._head
+		self._tracks = deque()
+		self._seqs = {}
+		self._head = 0
+		for track_id in tracks:
+			if track_id not in self._seqs:
+				self._seqs[track_id] = len(self._tracks)
+				self._tracks.append(track_id)
+		for track_id, pos in old.items():
+			if track_id not in self._seqs:
+				self.emit("track-removed", track_id, pos)
+		for pos, track_id in enumerate(self._tracks):
+			if track_id not in old:
+				self.emit("track-inserted", track_id, pos)
+			elif old[track_id] != pos:
+				self.emit("track-moved", track_id, pos)
@@ -0,0 +1,81 @@
+#!/usr/bin/python
+# Copyright (c) 2014 Cedric Bellegarde <gnumdk@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import random
+
+class WeightedSampler:
+
+	"""
+		Draw indexes in proportion to their integer weights
+		Weights are kept in a Fenwick tree, updates and draws are O(log n)
+		arg: [int]
+	"""
+	def __init__(self, weights):
+		self._weights = list(weights)
+		self._size = len(self._weights)
+		self._total = sum(self._weights)
+		# tree[i] is sum of weights in (i - lowbit(i), i], 1-based
+		self._tree = [0] + self._weights
+		for i in range(1, self._size + 1):
+			j = i + (i & -i)
+			if j <= self._size:
+				self._tree[j] += self._tree[i]
+		self._step = 1
+		while self._step * 2 <= self._size:
+			self._step *= 2
+
+	"""
+		Return weight at index
+		arg: int
+		ret: int
+	"""
+	def get_weight(self, index):
+		return self._weights[index]
+
+	"""
+		Set weight at index
+		arg: int, int
+	"""
+	def set_weight(self, index, weight):
+		delta = weight - self._weights[index]
+		self._weights[index] = weight
+		self._total += delta
+		i = index + 1
+		while i <= self._size:
+			self._tree[i] += delta
+			i += i & -i
+
+	"""
+		Return sum of weights
+		ret: int
+	"""
+	def get_total(self):
+		return self._total
+
+	"""
+		Return a random index, drawn in proportion to its weight
+		ret: int or None if all weights are null
+	"""
+	def sample(self):
+		if self._total <= 0:
+			return None
+		value = random.randrange(self._total)
+		pos = 0
+		step = self._step
+		# Find smallest index whose prefix sum is greater than value
+		while step:
+			if pos + step <= self._size and self._tree[pos + step] <= value:
+				pos += step
+				value -= self._tree[pos]
+			step //= 2
+		return pos
@@ -165,33 +165,14 @@ class SearchWidget(Gtk.Popover):
 		self._clear()
 		searched = self._text_entry.get_text()
 
-		albums = self._db.search_albums(searched)
-		
-		for artist_id in self._db.search_artists(searched):
-			for album_id in self._db.get_albums_by_artist_id(artist_id):
-				if (album_id, artist_id) not in albums:
-					albums.append((album_id, artist_id))
-
-		for album_id, artist_id in albums:
-			artist_name = self._db.get_artist_name_by_id(artist_id)
-			album_name = self._db.get_album_name_by_id(album_id)
-			search_row = SearchRow()
-			search_row.set_artist(artist_name)
-			search_row.set_item(album_name)
-			search_row.set_cover(self._art.get_small(album_id))
-			search_row.set_object_id(album_id)			
-			self._view.add(search_row)
-
-		for track_id, track_name in self._db.search_tracks(searched):
-			album_id = self._db.get_album_id_by_track_id(track_id)
-			artist_id = self._db.get_artist_id_by_album_id(album_id)
-			artist_name = self._db.get_artist_name_by_id(artist_id)
+		for is_track, object_id, name, artist_name, album_id in self._db.search(searched):
 			search_row = SearchRow()
 			search_row.set_artist(artist_name)
-			search_row.set_item(track_name)
+			search_row.set_item(name)
 			search_row.set_cover(self._art.get_small(album_id))
-			search_row.set_object_id(track_id)
-			search_row.track()
+			search_row.set_object_id(object_id)
+			if is_track:
+				search_row.track()
 			self._view.add(search_row)
 
 		
@@ -204,14 +185,14 @@ class SearchWidget(Gtk.Popover):
 		if row.is_track():
 			self._player.load(value_id)
 		else:
-			self._db.set_more_popular(value_id)
+			self._player.set_more_popular(value_id)
 			genre_id = self._db.get_genre_id_by_album_id(value_id)
 			# Get first track from album
 			track_id = self._db.get_track_ids_by_album_id(value_id)[0]
 			artist_id = self._db.get_artist_id_by_album_id(value_id)
 			self._player.load(track_id)
 			if not self._player.is_party():
-				self._db.set_more_popular(value_id)
+				self._player.set_more_popular(value_id)
 				self._player.set_albums(artist_id, genre_id, track_id)
 
 
@@ -53,7 +53,8 @@ class Toolbar(GObject.GObject):
 
 		self._player.connect("playback-status-changed", self._playback_status_changed)
 		self._player.connect("current-changed", self.update_toolbar)
-		self._player.set_progress_callback(self._progress_callback)
+		self._position_listener = None
+		self.set_position_updates(True)
 		
 		self._shuffle_btn = self._ui.get_object('shuffle-button')
 		self._shuffle_btn.connect("toggled", self._shuffle_update)
@@ -79,6 +80,18 @@ class Toolbar(GObject.GObject):
 
 		self.header_bar.set_show_close_button(True)
 
+	"""
+		Follow player position if enabled
+		Disable it while toolbar is not visible
+		arg: bool
+	"""
+	def set_position_updates(self, enabled):
+		if enabled and self._position_listener is None:
+			self._position_listener = self._player.add_position_listener(self._on_position)
+		elif not enabled and self._position_listener is not None:
+			self._player.remove_position_listener(self._position_listener)
+			self._position_listener = None
+
 	"""
 		Return information eventbox
 	"""
@@ -139,16 +152,28 @@ class Toolbar(GObject.GObject):
 	"""
 		Update progress bar position and set time label
 	"""
-	def _progress_callback(self, position):
-		self._progress.set_value(position)
-		self._time_label.set_text(self._player.seconds_to_string(position/60))
+	def _on_position(self, position):
+		if position > 0:
+			self._progress.set_value(position * 60)
+			self._time_label.set_text(self._player.seconds_to_string(position))
 	
 	"""
-		Update buttons and progress bar
+		Update buttons, progress bar and modes toggles
+		Modes may have been restored by player
 	"""
 	def _playback_status_changed(self, obj):
 		playing = self._player.is_playing()
 
+		if self._shuffle_btn.get_active() != self._player.is_shuffle():
+			self._shuffle_btn.handler_block_by_func(self._shuffle_update)
+			self._shuffle_btn.set_active(self._player.is_shuffle())
+			self._shuffle_btn.handler_unblock_by_func(self._shuffle_update)
+		if self._party.get_active() != self._player.is_party():
+			self._party.handler_block_by_func(self._party_update)
+			self._party.set_active(self._player.is_party())
+			self._party.handler_unblock_by_func(self._party_update)
+			self._update_party_ui(self._player.is_party())
+
 		self._progress.set_sensitive(playing)
 		if playing:
 			self._change_play_btn_status(self._pause_image, _("Pause"))
@@ -210,8 +235,14 @@ class Toolbar(GObject.GObject):
 		Set party mode on if party button active
 	"""
 	def _party_update(self, obj):
-		settings = Gtk.Settings.get_default()
 		active = self._party.get_active()
+		self._update_party_ui(active)
+		self._player.set_party(active)
+
+	"""
+		Show party mode state: dark theme and shuffle button disabled if active
+	"""
+	def _update_party_ui(self, active):
+		settings = Gtk.Settings.get_default()
 		self._shuffle_btn.set_sensitive(not active)
 		settings.set_property("gtk-application-prefer-dark-theme", active)
-		self._player.set_party(active)
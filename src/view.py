@@ -13,9 +13,10 @@
 # Many code inspiration from gnome-music at the GNOME project
 
 from gi.repository import Gtk, GObject, Gdk
-from gettext import gettext as _
+from gettext import gettext as _, ngettext
 
 from lollypop.database import Database
+from lollypop.collectionscanner import ScanStage
 from lollypop.widgets import *
 from lollypop.utils import translate_artist_name
 
@@ -38,6 +39,21 @@ class LoadingView(Gtk.Grid):
 			obj.destroy()
 		Gtk.Grid.destroy(self)
 
+	"""
+		Show scan progress: scan stage, files seen, items done, items to do and eta in seconds
+	"""
+	def set_progress(self, stage, seen, done, total, eta):
+		text = _("Loading please wait...") + "\n"
+		if total == 0 or eta == -1:
+			text += ngettext("%d file found", "%d files found", seen) % seen
+		else:
+			if stage == ScanStage.COVERS:
+				text += _("%d/%d covers cached") % (done, total)
+			else:
+				text += _("%d/%d files read") % (done, total)
+			text += "\n" + _("%d:%02d remaining") % (eta // 60, eta % 60)
+		self._label.set_label(text)
+
 class View(Gtk.Grid):
 	def __init__(self, db, player, genre_id):
 		Gtk.Grid.__init__(self)
@@ -186,7 +202,7 @@ class ArtistView(View):
 		if not self._player.is_party():
 			album_id = self._db.get_album_id_by_track_id(track_id)
 			self._player.set_albums(self._object_id, self._genre_id, track_id)
-			self._db.set_more_popular(album_id)
+			self._player.set_more_popular(album_id)
 
 class AlbumView(View):
 
@@ -233,10 +249,8 @@ class AlbumView(View):
 		Populate albums with popular ones
 	"""			
 	def populate_popular(self):
-		# We are in a thread, can't use global db object
-		db = Database()
-		for album_id in db.get_albums_popular():
-			widget = AlbumWidget(db, album_id)
+		for album_id in self._db.get_albums_popular():
+			widget = AlbumWidget(self._db, album_id)
 			widget.show()
 			self._albumbox.insert(widget, -1)
 
@@ -318,5 +332,5 @@ class AlbumView(View):
 		if not self._player.is_party():
 			album_id = self._db.get_album_id_by_track_id(track_id)
 			self._player.set_albums(None, self._genre_id, track_id)
-			self._db.set_more_popular(album_id)
+			self._player.set_more_popular(album_id)
 		
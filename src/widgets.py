@@ -38,7 +38,9 @@ class AlbumWidget(Gtk.Grid):
 		self._db = db
 		self._art = AlbumArt(db)
 		
-		self._ui.get_object('cover').set_from_pixbuf(self._art.get(album_id))
+		self._cover = self._ui.get_object('cover')
+		self._cover.set_from_pixbuf(self._art.get_async(album_id, self._set_cover))
+		self.connect("destroy", self._on_destroy)
 
 		label = self._db.get_album_name_by_id(album_id)
 		title = self._ui.get_object('title')
@@ -57,6 +59,22 @@ class AlbumWidget(Gtk.Grid):
 	def get_id(self):
 		return self._album_id
 
+#######################
+# PRIVATE             #
+#######################
+
+	"""
+		Set cover once decoded
+	"""
+	def _set_cover(self, pixbuf):
+		self._cover.set_from_pixbuf(pixbuf)
+
+	"""
+		Do not wait for cover anymore
+	"""
+	def _on_destroy(self, widget):
+		self._art.cancel_async(self._album_id, self._set_cover)
+
 class AlbumWidgetSongs(Gtk.Grid):
 
 	__gsignals__ = {
@@ -76,6 +94,8 @@ class AlbumWidgetSongs(Gtk.Grid):
 		
 		self._tracks_ui = []
 		self._tracks = []
+		# Track widgets by track id
+		self._tracks_by_id = {}
 		self._db = db
 		self._player = player
 		self._art = AlbumArt(db)
@@ -83,12 +103,17 @@ class AlbumWidgetSongs(Gtk.Grid):
 		self.set_hexpand(False)
 		grid = self._ui.get_object('grid2')
 		self._nb_tracks = self._db.get_tracks_count_for_album_id(album_id)
-		self._ui.get_object('cover').set_from_pixbuf(self._art.get(album_id))
+		self._cover = self._ui.get_object('cover')
+		self._cover.set_from_pixbuf(self._art.get_async(album_id, self._set_cover))
+		self.connect("destroy", self._on_destroy)
 		self._ui.get_object('title').set_label(self._db.get_album_name_by_id(album_id))
 		self._ui.get_object('year').set_label(self._db.get_album_year_by_id(album_id))
 		self.add(self._ui.get_object('AlbumWidgetSongs'))
 
-		self._player.connect("playlist-changed", self._update_pos_labels)
+		queue = self._player.get_playqueue()
+		self._queue_signals = [queue.connect("track-inserted", self._on_track_inserted),
+				       queue.connect("track-removed", self._on_track_removed),
+				       queue.connect("track-moved", self._on_track_moved)]
 
 		self._album_id = album_id
 	
@@ -129,6 +154,23 @@ class AlbumWidgetSongs(Gtk.Grid):
 # PRIVATE             #
 #######################
 
+	"""
+		Set cover once decoded
+	"""
+	def _set_cover(self, pixbuf):
+		self._cover.set_from_pixbuf(pixbuf)
+
+	"""
+		Do not wait for cover anymore and stop following play queue
+		Also called when parent is destroyed, destroy() is not
+	"""
+	def _on_destroy(self, widget):
+		self._art.cancel_async(self._album_id, self._set_cover)
+		queue = self._player.get_playqueue()
+		for signal in self._queue_signals:
+			queue.disconnect(signal)
+		self._queue_signals = []
+
 	"""
 		Add tracks for album_id to Album widget
 	"""
@@ -148,6 +190,7 @@ class AlbumWidgetSongs(Gtk.Grid):
 			ui.get_object('num').set_markup('<span color=\'grey\'>%d</span>' % len(self._tracks))
 			track_widget.title = ui.get_object('title')
 			track_widget.id = track_id
+			self._tracks_by_id[track_id] = track_widget
 			if not track_id == self._player.get_current_track_id():
 				track_widget.playing.set_no_show_all('True')
 				track_widget.title.set_text(name)
@@ -180,15 +223,45 @@ class AlbumWidgetSongs(Gtk.Grid):
 				self._player.del_from_playlist(widget.id)
 			else:
 				self._player.add_to_playlist(widget.id)
-			self._update_pos_labels()
 
 	"""
 		Update all position labels
 	"""
-	def _update_pos_labels(self, obj = None):
+	def _update_pos_labels(self):
 		for track_widget in self._tracks:
 			self._update_pos_label(track_widget)
 
+	"""
+		Update position label of inserted track
+		Others labels only change if track was not appended
+	"""
+	def _on_track_inserted(self, queue, track_id, pos):
+		if pos == len(queue) - 1:
+			track_widget = self._tracks_by_id.get(track_id)
+			if track_widget:
+				self._update_pos_label(track_widget)
+		else:
+			self._update_pos_labels()
+
+	"""
+		Update position labels, removed track and following ones changed
+	"""
+	def _on_track_removed(self, queue, track_id, pos):
+		if pos == len(queue):
+			track_widget = self._tracks_by_id.get(track_id)
+			if track_widget:
+				self._update_pos_label(track_widget)
+		else:
+			self._update_pos_labels()
+
+	"""
+		Update position label of moved track
+	"""
+	def _on_track_moved(self, queue, track_id, pos):
+		track_widget = self._tracks_by_id.get(track_id)
+		if track_widget:
+			self._update_pos_label(track_widget)
+
 	"""
 		Update postion label for track widget
 	"""
@@ -18,6 +18,7 @@ from gettext import gettext as _, ngettext
 from lollypop.collectionscanner import CollectionScanner
 from lollypop.toolbar import Toolbar
 from lollypop.database import Database
+from lollypop.albumart import AlbumArt
 from lollypop.selectionlist import SelectionList
 from lollypop.player import Player
 from lollypop.view import *
@@ -35,6 +36,7 @@ class Window(Gtk.ApplicationWindow):
 		self._db = db
 		self._player = player
 		self._scanner = CollectionScanner()
+		self._scanner.connect("scan-progress", self._on_scan_progress)
 		self._settings = Gio.Settings.new('org.gnome.Lollypop')
 
 		self._artist_signal_id = 0
@@ -51,6 +53,7 @@ class Window(Gtk.ApplicationWindow):
 		self._player.set_party_ids(ids)
 		
 		self.connect("map-event", self._on_mapped_window)
+		self.connect("destroy", self._on_destroy)
 
 
 
@@ -93,6 +96,7 @@ class Window(Gtk.ApplicationWindow):
 		Empty database if reinit True
 	"""
 	def update_db(self, reinit):
+		self._scanner.stop()
 		if reinit:
 			self._player.stop()
 			self._player.clear_albums()
@@ -245,10 +249,27 @@ class Window(Gtk.ApplicationWindow):
 			genres = self._db.get_all_genres()
 			self._update_genres(genres)
 		
+	"""
+		Show scan progress in loading view
+	"""
+	def _on_scan_progress(self, scanner, stage, seen, done, total, eta):
+		if isinstance(self._view, LoadingView):
+			self._view.set_progress(stage, seen, done, total, eta)
+
+	"""
+		Cancel running collection scan
+		Save player state for next startup
+	"""
+	def _on_destroy(self, widget):
+		self._scanner.stop()
+		self._player.save_state()
+
 	"""
 		Update genres list with genres
 	"""
 	def _update_genres(self, genres):
+		# Album ids may have changed
+		AlbumArt(self._db).clear_cache()
 		genres.insert(0, (-1, _("All genres")))
 		genres.insert(0, (-2, _("Populars albums")))
 		self._list_genres.populate(genres)
@@ -317,9 +338,13 @@ class Window(Gtk.ApplicationWindow):
 
 	"""
 		Save maximised state
+		Only follow player position while window is visible
 	"""
 	def _on_window_state_event(self, widget, event):
 		self._settings.set_boolean('window-maximized', 'GDK_WINDOW_STATE_MAXIMIZED' in event.new_window_state.value_names)
+		hidden = 'GDK_WINDOW_STATE_ICONIFIED' in event.new_window_state.value_names or\
+			 'GDK_WINDOW_STATE_WITHDRAWN' in event.new_window_state.value_names
+		self._toolbar.set_position_updates(not hidden)
 
 	"""
 		Show current album context/content